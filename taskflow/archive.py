@@ -0,0 +1,208 @@
+"""Архив выполненных задач
+
+Выполненные задачи вместе с комментариями переносятся из рабочих таблиц
+в отдельный файл <база>_archive.db, который подключается к соединению
+через ATTACH только когда архив действительно нужен. Рабочие запросы
+при этом работают только с активными задачами.
+"""
+
+import os
+import threading
+
+import change_log
+from enums import STATUS_DONE
+
+# Сколько задач переносить за одну транзакцию
+ARCHIVE_BATCH = 5000
+
+ARCHIVED_TABLES = ('tasks', 'comments')
+
+
+def archive_path(db_name):
+    """Файл архива для базы db_name"""
+    stem, ext = os.path.splitext(db_name)
+    return f"{stem}_archive{ext or '.db'}"
+
+
+class Archive:
+    """Перенос задач в архив, поиск по архиву и восстановление"""
+
+    def __init__(self, db):
+        self.db = db
+        self.path = archive_path(db.db_name)
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def exists(self):
+        """Есть ли файл архива"""
+        return os.path.exists(self.path)
+
+    def connect(self):
+        """Соединение текущего потока с подключённым архивом"""
+        conn = self.db.attach('archive', self.path)
+        with self._schema_lock:
+            if not self._schema_ready:
+                self._sync_schema(conn)
+                self._schema_ready = True
+        return conn
+
+    def _sync_schema(self, conn):
+        """Таблицы архива повторяют рабочие и получают новые столбцы после миграций"""
+        for table in ARCHIVED_TABLES:
+            main_columns = conn.execute(f"PRAGMA main.table_info({table})").fetchall()
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS archive.{table} AS SELECT * FROM main.{table} WHERE 0"
+            )
+            archived = {row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})")}
+            for row in main_columns:
+                if row[1] not in archived:
+                    conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN {row[1]} {row[2]}")
+            if 'archived_date' not in archived:
+                conn.execute(f"ALTER TABLE archive.{table} ADD COLUMN archived_date TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_tasks_id ON tasks (id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_tasks_project ON tasks (project_id, created_date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_archive_comments_task ON comments (task_id)")
+        conn.commit()
+
+    def columns(self, table):
+        """Столбцы рабочей таблицы через запятую (общие с архивом)"""
+        conn = self.db.connection
+        return ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+
+    # Перенос
+    def archive_completed(self, days=30, project_id=None, batch_size=ARCHIVE_BATCH):
+        """Перенос задач, выполненных более days дней назад; возвращает их количество"""
+        query = """SELECT id FROM main.tasks
+                   WHERE status = ? AND COALESCE(status_date, created_date) < datetime('now', ?)"""
+        params = [STATUS_DONE, f"{-int(days)} days"]
+        if project_id is not None:
+            query += " AND project_id = ?"
+            params.append(project_id)
+        query += " LIMIT ?"
+        params.append(batch_size)
+
+        total = 0
+        while True:
+            moved = self._move_selected(query, params, 'main', 'archive')
+            total += moved
+            if moved < batch_size:
+                return total
+
+    def archive_tasks(self, task_ids):
+        """Перенос в архив задач с указанными ID"""
+        return self._move_ids(task_ids, 'main', 'archive')
+
+    def restore_tasks(self, task_ids):
+        """Возврат задач из архива в рабочие таблицы"""
+        return self._move_ids(task_ids, 'archive', 'main')
+
+    def restore_project(self, project_id):
+        """Возврат всех архивных задач проекта; возвращает их ID"""
+        if not self.exists():
+            return []
+        conn = self.connect()
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM archive.tasks WHERE project_id = ?", (project_id,)
+        )]
+        self.restore_tasks(ids)
+        return ids
+
+    def purge_project(self, project_id):
+        """Удаление архивных задач проекта"""
+        if not self.exists():
+            return
+        self.connect()
+        with self.db.transaction() as conn:
+            change_log.log_archive(conn, 'comments', 'D', "task_id IN "
+                                   "(SELECT id FROM archive.tasks WHERE project_id = ?)", (project_id,))
+            change_log.log_archive(conn, 'tasks', 'D', "project_id = ?", (project_id,))
+            conn.execute(
+                "DELETE FROM archive.comments WHERE task_id IN "
+                "(SELECT id FROM archive.tasks WHERE project_id = ?)", (project_id,)
+            )
+            conn.execute("DELETE FROM archive.tasks WHERE project_id = ?", (project_id,))
+
+    def _move_ids(self, task_ids, source, target):
+        task_ids = list(task_ids)
+        moved = 0
+        for start in range(0, len(task_ids), ARCHIVE_BATCH):
+            chunk = task_ids[start:start + ARCHIVE_BATCH]
+            query = f"SELECT id FROM {source}.tasks WHERE id IN ({', '.join('?' * len(chunk))})"
+            moved += self._move_selected(query, chunk, source, target)
+        return moved
+
+    def _move_selected(self, select_ids, params, source, target):
+        """Перенос задач (ID выбирает select_ids) и их комментариев одной транзакцией"""
+        self.connect()
+        task_columns = self.columns('tasks')
+        comment_columns = self.columns('comments')
+        # В архиве дополнительно запоминается дата переноса
+        extra_columns = ", archived_date" if target == 'archive' else ""
+        extra_values = ", CURRENT_TIMESTAMP" if target == 'archive' else ""
+
+        with self.db.transaction() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.archive_batch")
+            count = conn.execute(f"INSERT INTO temp.archive_batch {select_ids}", params).rowcount
+            if count <= 0:
+                return 0
+
+            conn.execute(
+                f"INSERT INTO {target}.tasks ({task_columns}{extra_columns}) "
+                f"SELECT {task_columns}{extra_values} FROM {source}.tasks "
+                f"WHERE id IN (SELECT id FROM temp.archive_batch)"
+            )
+            conn.execute(
+                f"INSERT INTO {target}.comments ({comment_columns}{extra_columns}) "
+                f"SELECT {comment_columns}{extra_values} FROM {source}.comments "
+                f"WHERE task_id IN (SELECT id FROM temp.archive_batch) ORDER BY id"
+            )
+            # Триггеры журнала изменений есть только у рабочих таблиц
+            op = 'I' if target == 'archive' else 'D'
+            change_log.log_archive(conn, 'tasks', op, "id IN (SELECT id FROM temp.archive_batch)")
+            change_log.log_archive(conn, 'comments', op, "task_id IN (SELECT id FROM temp.archive_batch)")
+            if target == 'main':
+                # Триггеры посчитали вставленные комментарии новыми: прибавили их
+                # к сохранённому счётчику и обновили время активности
+                conn.execute(
+                    "UPDATE main.tasks SET "
+                    "comment_count = (SELECT COUNT(*) FROM main.comments c WHERE c.task_id = tasks.id), "
+                    "last_activity = (SELECT a.last_activity FROM archive.tasks a WHERE a.id = tasks.id) "
+                    "WHERE id IN (SELECT id FROM temp.archive_batch)"
+                )
+            conn.execute(
+                f"DELETE FROM {source}.comments WHERE task_id IN (SELECT id FROM temp.archive_batch)"
+            )
+            conn.execute(
+                f"DELETE FROM {source}.tasks WHERE id IN (SELECT id FROM temp.archive_batch)"
+            )
+            return count
+
+    # Чтение
+    def get_tasks(self, project_id, columns=None):
+        """Архивные задачи проекта
+
+        columns - столбцы в нужном порядке; по умолчанию все столбцы рабочей
+        таблицы в порядке PRAGMA table_info.
+        """
+        if not self.exists():
+            return []
+        conn = self.connect()
+        selected = ", ".join(columns) if columns else self.columns('tasks')
+        return conn.execute(
+            f"SELECT {selected} FROM archive.tasks "
+            f"WHERE project_id = ? ORDER BY created_date DESC",
+            (project_id,)
+        ).fetchall()
+
+    def get_comments(self, task_id, columns=None):
+        """Архивные комментарии задачи (columns - как в get_tasks)"""
+        if not self.exists():
+            return []
+        conn = self.connect()
+        selected = ", ".join(columns) if columns else self.columns('comments')
+        return conn.execute(
+            f"SELECT {selected} FROM archive.comments "
+            f"WHERE task_id = ? ORDER BY created_date DESC",
+            (task_id,)
+        ).fetchall()
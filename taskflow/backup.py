@@ -0,0 +1,385 @@
+"""Резервное копирование и восстановление базы задач
+
+Снимки снимаются онлайн через sqlite3 backup API небольшими порциями
+страниц, поэтому запись в базу во время копирования блокируется лишь
+ненадолго. Снимки сжимаются gzip, проверяются PRAGMA integrity_check и
+ротируются. Файл архива (<база>_archive.db) входит в тот же снимок.
+Вместе с журналом изменений (change_log) поддерживается восстановление на
+момент времени.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import change_log
+from archive import Archive, archive_path
+from task_manager import Database
+
+# Сколько страниц копировать за один шаг и пауза между шагами (секунды)
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+
+# Запись из другого соединения начинает копирование заново; после стольких
+# перезапусков остаток копируется одним шагом
+BACKUP_RESTARTS = 3
+
+# Предельное время создания снимка (секунды)
+SNAPSHOT_TIMEOUT = 600
+
+SNAPSHOT_SUFFIX = '.db.gz'
+ARCHIVE_SUFFIX = '_archive.db.gz'
+MANIFEST_SUFFIX = '.json'
+
+# Сколько раз повторять копирование, если во время него изменился архив;
+# последняя попытка выполняется внутри транзакции чтения
+SNAPSHOT_ATTEMPTS = 3
+
+
+def utc_timestamp(moment=None):
+    """Время UTC в формате CURRENT_TIMESTAMP"""
+    return (moment or datetime.now(timezone.utc)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class _Restarted(Exception):
+    """Копирование порциями слишком часто начиналось заново"""
+
+
+class BackupManager:
+    """Снимки базы данных, их ротация, проверка и восстановление"""
+
+    def __init__(self, db_name='tasks.db', backup_dir='backups', keep=7,
+                 pages=BACKUP_PAGES, sleep=BACKUP_SLEEP, timeout=SNAPSHOT_TIMEOUT):
+        self.db_name = db_name
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.pages = pages
+        self.sleep = sleep
+        self.timeout = timeout
+
+    # Журнал изменений
+    def enable_change_log(self):
+        """Включение журнала изменений в рабочей базе"""
+        conn = sqlite3.connect(self.db_name)
+        change_log.enable(conn.cursor())
+        conn.commit()
+        conn.close()
+
+    # Снимки
+    def create_snapshot(self, progress=None):
+        """Снимок базы; возвращает описание снимка или None при ошибке проверки
+
+        progress(remaining, total) вызывается после каждого шага копирования.
+        Если снимок не удалось снять за timeout секунд, выбрасывается
+        TimeoutError.
+        """
+        os.makedirs(self.backup_dir, exist_ok=True)
+        handle, raw_path = tempfile.mkstemp(suffix='.db', dir=self.backup_dir)
+        os.close(handle)
+        raw_archive = archive_path(raw_path)
+        with_archive = os.path.exists(archive_path(self.db_name))
+
+        source = sqlite3.connect(self.db_name)
+        try:
+            if with_archive:
+                source.execute("ATTACH DATABASE ? AS archive", (archive_path(self.db_name),))
+            try:
+                self._copy_consistent(source, raw_path, raw_archive if with_archive else None,
+                                      progress, time.monotonic() + self.timeout)
+            except TimeoutError:
+                for path in (raw_path, raw_archive):
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+            # Снимок содержит все изменения до момента окончания копирования
+            finished = datetime.now(timezone.utc)
+            raw_files = [raw_path, raw_archive] if with_archive else [raw_path]
+            if not all(self._file_ok(path) for path in raw_files):
+                for path in raw_files:
+                    os.remove(path)
+                return None
+            target = sqlite3.connect(raw_path)
+            log_id = change_log.last_id(target.cursor())
+            target.close()
+        finally:
+            source.close()
+        
+        created = utc_timestamp(finished)
+        stem = os.path.splitext(os.path.basename(self.db_name))[0]
+        name = f"{stem}-{finished.strftime('%Y%m%d_%H%M%S_%f')}"
+
+        snapshot_path = os.path.join(self.backup_dir, name + SNAPSHOT_SUFFIX)
+        size = self._pack(raw_path, snapshot_path)
+        archive_snapshot = None
+        if with_archive:
+            archive_snapshot = os.path.join(self.backup_dir, name + ARCHIVE_SUFFIX)
+            self._pack(raw_archive, archive_snapshot)
+
+        snapshot = {
+            'path': snapshot_path,
+            'archive_path': archive_snapshot,
+            'created': created,
+            'source': os.path.abspath(self.db_name),
+            'change_log_id': log_id,
+            'size': size,
+            'compressed_size': os.path.getsize(snapshot_path),
+        }
+        with open(snapshot_path[:-len(SNAPSHOT_SUFFIX)] + MANIFEST_SUFFIX, 'w', encoding='utf-8') as manifest:
+            json.dump(snapshot, manifest, ensure_ascii=False, indent=2)
+
+        self.rotate()
+        return snapshot
+
+    def _copy_consistent(self, source, raw_path, raw_archive=None, progress=None, deadline=None):
+        """Копирование базы и архива, согласованных между собой
+
+        Каждый файл backup API копирует целостно, но перенос задач в архив
+        между двумя копированиями дал бы снимки разных моментов. Если архив
+        за время копирования изменился, копирование повторяется.
+        """
+        for attempt in range(SNAPSHOT_ATTEMPTS):
+            locked = raw_archive is not None and attempt == SNAPSHOT_ATTEMPTS - 1
+            if locked:
+                # Транзакция чтения не даёт менять обе базы до конца копирования
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM main.sqlite_master").fetchone()
+                source.execute("SELECT COUNT(*) FROM archive.sqlite_master").fetchone()
+            try:
+                version = self._archive_version(source) if raw_archive else None
+                self._copy(source, raw_path, 'main', progress, deadline)
+                if raw_archive is None:
+                    return
+                self._copy(source, raw_archive, 'archive', deadline=deadline)
+                if locked or self._archive_version(source) == version:
+                    return
+            finally:
+                if locked:
+                    source.rollback()
+
+    def _copy(self, source, path, name, progress=None, deadline=None):
+        """Копирование базы name соединения source в файл path порциями страниц
+
+        Пока другое соединение пишет в базу, backup API после каждой записи
+        начинает копирование с первой страницы (remaining растёт). После
+        BACKUP_RESTARTS перезапусков остаток копируется одним шагом: запись
+        на это время ждёт, зато копирование заканчивается.
+        """
+        last = {'remaining': None, 'restarts': 0}
+
+        def check(remaining, total):
+            if progress:
+                progress(remaining, total)
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Снимок не создан за {self.timeout} с")
+
+        def step(status, remaining, total):
+            check(remaining, total)
+            if last['remaining'] is not None and remaining > last['remaining']:
+                last['restarts'] += 1
+                if last['restarts'] >= BACKUP_RESTARTS:
+                    raise _Restarted()
+            last['remaining'] = remaining
+
+        target = sqlite3.connect(path)
+        try:
+            try:
+                source.backup(target, pages=self.pages, sleep=self.sleep, progress=step, name=name)
+            except _Restarted:
+                source.backup(target, pages=-1, sleep=self.sleep,
+                              progress=lambda status, remaining, total: check(remaining, total),
+                              name=name)
+        finally:
+            target.close()
+
+    @staticmethod
+    def _archive_version(source):
+        return source.execute("PRAGMA archive.data_version").fetchone()[0]
+
+    @staticmethod
+    def _pack(raw_path, packed_path):
+        """Сжатие файла в снимок; возвращает исходный размер"""
+        with open(raw_path, 'rb') as raw, gzip.open(packed_path, 'wb', compresslevel=6) as packed:
+            shutil.copyfileobj(raw, packed, 1024 * 1024)
+        size = os.path.getsize(raw_path)
+        os.remove(raw_path)
+        return size
+
+    def list_snapshots(self):
+        """Снимки от старых к новым"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        snapshots = []
+        for file_name in os.listdir(self.backup_dir):
+            if not file_name.endswith(MANIFEST_SUFFIX):
+                continue
+            with open(os.path.join(self.backup_dir, file_name), encoding='utf-8') as manifest:
+                snapshot = json.load(manifest)
+            if os.path.exists(snapshot['path']):
+                snapshots.append(snapshot)
+        snapshots.sort(key=lambda snapshot: (snapshot['created'], snapshot['path']))
+        return snapshots
+
+    def rotate(self):
+        """Удаление старых снимков сверх keep"""
+        snapshots = self.list_snapshots()
+        for snapshot in snapshots[:max(len(snapshots) - self.keep, 0)]:
+            os.remove(snapshot['path'])
+            if snapshot.get('archive_path') and os.path.exists(snapshot['archive_path']):
+                os.remove(snapshot['archive_path'])
+            os.remove(snapshot['path'][:-len(SNAPSHOT_SUFFIX)] + MANIFEST_SUFFIX)
+
+    def verify(self, snapshot):
+        """Проверка целостности снимка (вместе с архивом)"""
+        for packed_path in (snapshot['path'], snapshot.get('archive_path')):
+            if packed_path is None:
+                continue
+            raw_path = self._unpack(packed_path)
+            try:
+                if not self._file_ok(raw_path):
+                    return False
+            finally:
+                os.remove(raw_path)
+        return True
+
+    # Восстановление
+    def restore(self, snapshot=None, until=None, target=None):
+        """Восстановление базы из снимка, при until - на момент времени
+
+        Без snapshot берётся последний снимок не позже until. Записи журнала
+        изменений рабочей базы после снимка и не позже until применяются
+        поверх снимка. Архив восстанавливается вместе с базой. Возвращает
+        количество применённых записей журнала.
+        """
+        target = target or self.db_name
+        if snapshot is None:
+            snapshot = self._pick_snapshot(until)
+            if snapshot is None:
+                raise ValueError("Нет подходящего снимка")
+
+        raw_path = self._unpack(snapshot['path'])
+        raw_archive = archive_path(raw_path)
+        try:
+            if snapshot.get('archive_path'):
+                self._unpack(snapshot['archive_path'], raw_archive)
+            for path in (raw_path, raw_archive):
+                if os.path.exists(path) and not self._file_ok(path):
+                    raise ValueError(f"Снимок повреждён: {snapshot['path']}")
+            
+            # Приводим схему снимка к текущей версии; архив нужен, даже если
+            # его не было в снимке, но он появился позже (записи журнала)
+            with_archive = os.path.exists(raw_archive) or os.path.exists(archive_path(self.db_name))
+            db = Database(raw_path)
+            if with_archive:
+                Archive(db).connect()
+            db.close()
+            restored = sqlite3.connect(raw_path)
+            if with_archive:
+                restored.execute("ATTACH DATABASE ? AS archive", (raw_archive,))
+
+            replayed = 0
+            if until is not None and os.path.exists(self.db_name):
+                live = sqlite3.connect(self.db_name)
+                if change_log.is_enabled(live.cursor()):
+                    log_entries = change_log.entries(live.cursor(), snapshot['change_log_id'], until)
+                    replayed = change_log.replay(restored.cursor(), log_entries)
+                    restored.commit()
+                live.close()
+
+            # Запись в рабочую базу тем же backup API, порциями
+            destination = sqlite3.connect(target)
+            restored.backup(destination, pages=self.pages, sleep=self.sleep)
+            destination.close()
+            if with_archive:
+                destination = sqlite3.connect(archive_path(target))
+                restored.backup(destination, pages=self.pages, sleep=self.sleep, name='archive')
+                destination.close()
+            elif os.path.exists(archive_path(target)):
+                # На момент снимка архива ещё не было
+                os.remove(archive_path(target))
+            restored.close()
+            return replayed
+        finally:
+            for path in (raw_path, raw_archive):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _pick_snapshot(self, until):
+        snapshots = self.list_snapshots()
+        if until is not None:
+            bound = change_log.timestamp_bound(until)
+            snapshots = [snapshot for snapshot in snapshots if snapshot['created'] <= bound]
+        return snapshots[-1] if snapshots else None
+
+    def _unpack(self, packed_path, raw_path=None):
+        """Распаковка снимка в raw_path или во временный файл"""
+        if raw_path is None:
+            handle, raw_path = tempfile.mkstemp(suffix='.db', dir=self.backup_dir)
+            raw = os.fdopen(handle, 'wb')
+        else:
+            raw = open(raw_path, 'wb')
+        with raw, gzip.open(packed_path, 'rb') as packed:
+            shutil.copyfileobj(packed, raw, 1024 * 1024)
+        return raw_path
+
+    def _file_ok(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            return self._integrity_ok(conn)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _integrity_ok(conn):
+        return conn.execute("PRAGMA integrity_check").fetchone()[0] == 'ok'
+
+
+def main():
+    """Резервное копирование из командной строки"""
+    parser = argparse.ArgumentParser(description="Резервные копии TaskFlow")
+    parser.add_argument('--db', default='tasks.db')
+    parser.add_argument('--dir', default='backups')
+    parser.add_argument('--keep', type=int, default=7)
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('snapshot', help="создать снимок")
+    commands.add_parser('list', help="список снимков")
+    commands.add_parser('verify', help="проверить все снимки")
+    commands.add_parser('enable-log', help="включить журнал изменений")
+    restore = commands.add_parser('restore', help="восстановить базу")
+    restore.add_argument('--until', help="момент времени UTC, 'YYYY-MM-DD HH:MM:SS'")
+    args = parser.parse_args()
+
+    manager = BackupManager(args.db, args.dir, args.keep)
+    if args.command == 'snapshot':
+        try:
+            snapshot = manager.create_snapshot()
+        except TimeoutError as e:
+            print(e)
+            return 1
+        if snapshot is None:
+            print("Снимок не прошёл проверку целостности")
+            return 1
+        print(f"{snapshot['path']} ({snapshot['compressed_size']} байт)")
+    elif args.command == 'list':
+        for snapshot in manager.list_snapshots():
+            print(f"{snapshot['created']}  {snapshot['path']}  журнал до #{snapshot['change_log_id']}")
+    elif args.command == 'verify':
+        failed = [s['path'] for s in manager.list_snapshots() if not manager.verify(s)]
+        for path in failed:
+            print(f"Повреждён: {path}")
+        return 1 if failed else 0
+    elif args.command == 'enable-log':
+        manager.enable_change_log()
+    elif args.command == 'restore':
+        replayed = manager.restore(until=args.until)
+        print(f"База восстановлена, применено записей журнала: {replayed}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
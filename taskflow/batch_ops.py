@@ -0,0 +1,268 @@
+"""Массовые операции над задачами
+
+Простые операции (переназначение исполнителя, перевод статусов)
+выполняются одним UPDATE на множество строк. Автотриаж по правилам
+считается в пуле процессов порциями, а изменения записывает один
+писатель - основной процесс - по транзакции на порцию.
+
+Ночное обслуживание из cron:
+
+    python batch_ops.py nightly --days 30 --rules triage.json
+"""
+
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+
+# Количество задач в одной порции автотриажа
+CHUNK_SIZE = 5000
+
+
+class TriageRule:
+    """Правило автотриажа: если шаблон найден в поле задачи, задать значения
+
+    Статус и приоритет задаются названием, ключом или кодом справочника.
+    """
+
+    FIELDS = ('title', 'description', 'assignee')
+
+    def __init__(self, pattern, status=None, priority=None, assignee=None, field='title'):
+        if field not in self.FIELDS:
+            raise ValueError(f"Недопустимое поле правила: {field}")
+        self.pattern = pattern
+        self.status = status
+        self.priority = priority
+        self.assignee = assignee
+        self.field = field
+
+    def resolve(self, manager):
+        """Правило с кодами справочников, пригодное для передачи в процесс"""
+        status = manager.statuses.code(self.status) if self.status is not None else None
+        priority = manager.priorities.code(self.priority) if self.priority is not None else None
+        if self.status is not None and status is None:
+            raise ValueError(f"Неизвестный статус: {self.status}")
+        if self.priority is not None and priority is None:
+            raise ValueError(f"Неизвестный приоритет: {self.priority}")
+        return (self.pattern, self.FIELDS.index(self.field), status, priority, self.assignee)
+
+
+class ConsoleProgress:
+    """Индикатор выполнения в stderr"""
+
+    def __init__(self, label="Обработка", width=30):
+        self.label = label
+        self.width = width
+
+    def __call__(self, done, total):
+        if sys.stderr is None:
+            return
+        filled = self.width * done // total if total else self.width
+        sys.stderr.write(f"\r{self.label}: [{'#' * filled}{'.' * (self.width - filled)}] {done}/{total}")
+        if done >= total:
+            sys.stderr.write("\n")
+        sys.stderr.flush()
+
+
+class BatchProcessor:
+    """Массовые операции над задачами TaskManager (или всех шардов ShardedTaskManager)"""
+
+    def __init__(self, manager, progress=None):
+        self.manager = manager
+        self.targets = getattr(manager, 'shards', [manager])
+        self.progress = progress
+
+    # Операции одним запросом
+    def reassign(self, old_assignee, new_assignee, project_id=None):
+        """Передача всех задач одного исполнителя другому"""
+        return self._update(
+            "assignee = ?", [new_assignee], "assignee = ?", [old_assignee], project_id
+        )
+
+    def move_status(self, from_status, to_status, project_id=None):
+        """Перевод всех задач из одного статуса в другой"""
+        from_code = self.manager.statuses.code(from_status)
+        to_code = self.manager.statuses.code(to_status)
+        if from_code is None or to_code is None:
+            raise ValueError("Неизвестный статус")
+        return self._update("status = ?", [to_code], "status = ?", [from_code], project_id)
+
+    def archive_closed(self, project_id=None, days=30):
+        """Перенос в архив задач, выполненных более days дней назад"""
+        return sum(target.archive_completed(days, project_id) for target in self.targets)
+
+    def _update(self, assignment, values, condition, params, project_id):
+        query = f"UPDATE tasks SET {assignment}, version = version + 1 WHERE {condition}"
+        if project_id is not None:
+            query += " AND project_id = ?"
+            params = params + [project_id]
+        changed = 0
+        for target in self.targets:
+            with target.db.transaction() as conn:
+                changed += conn.execute(query, values + params).rowcount
+        return changed
+
+    # Автотриаж
+    def auto_triage(self, rules, project_id=None, workers=None, chunk_size=CHUNK_SIZE):
+        """Применение правил к задачам в пуле процессов
+
+        workers=1 выполняет правила в текущем процессе. Возвращает
+        количество изменённых задач.
+        """
+        resolved = [rule.resolve(self.manager) for rule in rules]
+        workers = workers or os.cpu_count() or 1
+        total = sum(self._count(target, project_id) for target in self.targets)
+        state = {'done': 0, 'changed': 0}
+
+        def apply(target, rows_count, updates):
+            # Единственный писатель: изменения порции - одной транзакцией
+            if updates:
+                with target.db.transaction() as conn:
+                    conn.executemany(
+                        """UPDATE tasks SET status = COALESCE(?, status),
+                                            priority = COALESCE(?, priority),
+                                            assignee = COALESCE(?, assignee),
+                                            version = version + 1
+                           WHERE id = ?""",
+                        updates
+                    )
+            state['done'] += rows_count
+            state['changed'] += len(updates)
+            if self.progress:
+                self.progress(state['done'], total)
+
+        if workers == 1:
+            for target in self.targets:
+                for rows in self._chunks(target, project_id, chunk_size):
+                    apply(target, len(rows), triage_chunk(resolved, rows))
+            return state['changed']
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for target in self.targets:
+                pending = {}
+                for rows in self._chunks(target, project_id, chunk_size):
+                    # Не держим в памяти больше двух порций на процесс
+                    if len(pending) >= workers * 2:
+                        self._drain(pending, apply, FIRST_COMPLETED)
+                    future = pool.submit(triage_chunk, resolved, rows)
+                    pending[future] = (target, len(rows))
+                self._drain(pending, apply, ALL_COMPLETED)
+        return state['changed']
+
+    @staticmethod
+    def _drain(pending, apply, return_when):
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            target, rows_count = pending.pop(future)
+            apply(target, rows_count, future.result())
+
+    @staticmethod
+    def _count(target, project_id):
+        if project_id is None:
+            return target.db.fetch_one("SELECT COUNT(*) FROM tasks")[0]
+        return target.count_tasks(project_id)
+
+    @staticmethod
+    def _chunks(target, project_id, chunk_size):
+        """Порции задач по возрастанию ID (обход по ключу, без OFFSET)"""
+        query = "SELECT id, title, description, assignee, status, priority FROM tasks WHERE id > ?"
+        if project_id is not None:
+            query += " AND project_id = ?"
+        query += " ORDER BY id LIMIT ?"
+        last_id = -1
+        while True:
+            params = [last_id] + ([project_id] if project_id is not None else []) + [chunk_size]
+            rows = target.db.fetch_all(query, params)
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+
+def triage_chunk(rules, rows):
+    """Расчёт изменений для порции задач (выполняется в дочернем процессе)
+
+    Для каждой задачи применяется первое подходящее правило. Возвращает
+    параметры UPDATE (status, priority, assignee, id) только для задач,
+    которые действительно меняются.
+    """
+    compiled = [(re.compile(pattern, re.IGNORECASE), field, status, priority, assignee)
+                for pattern, field, status, priority, assignee in rules]
+    updates = []
+    for task_id, title, description, current_assignee, current_status, current_priority in rows:
+        fields = (title or '', description or '', current_assignee or '')
+        for regex, field, status, priority, assignee in compiled:
+            if not regex.search(fields[field]):
+                continue
+            if ((status is not None and status != current_status)
+                    or (priority is not None and priority != current_priority)
+                    or (assignee is not None and assignee != current_assignee)):
+                updates.append((status, priority, assignee, task_id))
+            break
+    return updates
+
+
+def load_rules(path):
+    """Правила автотриажа из JSON: [{"pattern": ..., "status": ..., ...}, ...]"""
+    import json
+
+    with open(path, encoding='utf-8') as source:
+        return [TriageRule(**rule) for rule in json.load(source)]
+
+
+def main():
+    """Массовые операции и ночное обслуживание из командной строки"""
+    import argparse
+
+    from cli import CommandError, close_manager, find_project, make_manager
+
+    parser = argparse.ArgumentParser(description="Массовые операции TaskFlow")
+    parser.add_argument('--db', default=os.environ.get('TASKFLOW_DB', 'tasks.db'))
+    parser.add_argument('--workspace', default=os.environ.get('TASKFLOW_WORKSPACE'))
+    parser.add_argument('--project', help="ID или название проекта (по умолчанию - все)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    command = commands.add_parser('reassign', help="передать задачи другому исполнителю")
+    command.add_argument('old')
+    command.add_argument('new')
+    command = commands.add_parser('move-status', help="перевести задачи в другой статус")
+    command.add_argument('old')
+    command.add_argument('new')
+    command = commands.add_parser('archive', help="перенести выполненные задачи в архив")
+    command.add_argument('--days', type=int, default=30)
+    command = commands.add_parser('triage', help="автотриаж по правилам из JSON")
+    command.add_argument('rules')
+    command.add_argument('--workers', type=int, default=None)
+    command = commands.add_parser('nightly', help="ночное обслуживание: архив и автотриаж")
+    command.add_argument('--days', type=int, default=30)
+    command.add_argument('--rules', help="правила автотриажа (JSON)")
+    command.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        manager, registry = make_manager(args.db, args.workspace)
+    except (KeyError, ValueError) as e:
+        print(f"Ошибка: {e.args[0]}", file=sys.stderr)
+        return 1
+    progress = ConsoleProgress("Автотриаж") if sys.stderr is not None and sys.stderr.isatty() else None
+    processor = BatchProcessor(manager, progress)
+    try:
+        project_id = find_project(manager, args.project)['id'] if args.project else None
+        if args.command == 'reassign':
+            print(f"Переназначено задач: {processor.reassign(args.old, args.new, project_id)}")
+        elif args.command == 'move-status':
+            print(f"Изменено задач: {processor.move_status(args.old, args.new, project_id)}")
+        elif args.command in ('archive', 'nightly'):
+            print(f"Перенесено в архив: {processor.archive_closed(project_id, args.days)}")
+        if args.command == 'triage' or (args.command == 'nightly' and args.rules):
+            rules = load_rules(args.rules)
+            print(f"Изменено автотриажем: {processor.auto_triage(rules, project_id, args.workers)}")
+    except (CommandError, ValueError, OSError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    finally:
+        close_manager(manager, registry)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,190 @@
+"""Журнал изменений таблиц для восстановления на момент времени
+
+Триггеры записывают каждую вставку, изменение и удаление строки в таблицу
+change_log вместе с полным содержимым строки в JSON. Вместе со снимком
+базы журнал позволяет воспроизвести состояние на любой момент.
+"""
+
+import json
+
+LOGGED_TABLES = ('projects', 'tasks', 'comments')
+
+# Таблицы архива (archive.py); записи о них пишет сам архив
+ARCHIVE_LOGGED_TABLES = ('archive.tasks', 'archive.comments')
+
+TIMESTAMP_SQL = "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
+def is_enabled(cursor, schema='main'):
+    """Включён ли журнал в этой базе"""
+    row = cursor.execute(
+        f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = 'change_log'"
+    ).fetchone()
+    return row is not None
+
+
+def enable(cursor):
+    """Создание журнала и триггеров"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            op TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            data TEXT
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_change_log_ts ON change_log (ts)")
+    refresh_triggers(cursor)
+
+
+def disable(cursor):
+    """Удаление триггеров журнала (сам журнал сохраняется)"""
+    for table in LOGGED_TABLES:
+        for op in ('insert', 'update', 'delete'):
+            cursor.execute(f"DROP TRIGGER IF EXISTS change_log_{table}_{op}")
+
+
+def refresh_triggers(cursor):
+    """Пересоздание триггеров по текущему набору столбцов таблиц
+
+    Вызывается после миграций, чтобы в журнал попадали новые столбцы.
+    """
+    disable(cursor)
+    for table in LOGGED_TABLES:
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if not columns:
+            continue
+        for op, row in (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD')):
+            if op == 'delete':
+                data = 'NULL'
+            else:
+                data = "json_object(" + ", ".join(f"'{c}', {row}.{c}" for c in columns) + ")"
+            cursor.execute(f'''
+                CREATE TRIGGER change_log_{table}_{op}
+                AFTER {op.upper()} ON {table}
+                BEGIN
+                    INSERT INTO change_log (ts, table_name, op, row_id, data)
+                    VALUES ({TIMESTAMP_SQL}, '{table}', '{op[0].upper()}', {row}.id, {data});
+                END
+            ''')
+
+
+def log_archive(conn, table, op, condition, params=(), schema='archive', log_schema='main'):
+    """Запись в журнал строк archive.<table>, отобранных условием condition
+
+    В подключённой базе архива триггеров журнала нет, поэтому архив
+    вызывает эту функцию в той же транзакции, что и перенос задач.
+    schema и log_schema - под какими именами подключены архив и база с
+    журналом (при переносе проекта между шардами - не main и archive).
+    """
+    if not is_enabled(conn, log_schema):
+        return
+    data = 'NULL'
+    if op == 'I':
+        columns = [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")]
+        data = "json_object(" + ", ".join(f"'{c}', {c}" for c in columns) + ")"
+    conn.execute(f'''
+        INSERT INTO {log_schema}.change_log (ts, table_name, op, row_id, data)
+        SELECT {TIMESTAMP_SQL}, 'archive.{table}', '{op}', id, {data}
+        FROM {schema}.{table} WHERE {condition}
+    ''', params)
+
+
+def timestamp_bound(moment):
+    """Верхняя граница для ts по моменту until
+
+    ts хранится с миллисекундами, а момент обычно задаётся с точностью до
+    секунды (или минуты, дня) - тогда в него входит вся эта секунда.
+    """
+    moment = moment.strip().replace('T', ' ')
+    if len(moment) == 10:
+        return moment + ' 23:59:59.999'
+    if len(moment) == 16:
+        return moment + ':59.999'
+    if len(moment) == 19:
+        return moment + '.999'
+    return moment
+
+
+def last_id(cursor):
+    """ID последней записи журнала (0, если журнала нет)"""
+    if not is_enabled(cursor):
+        return 0
+    return cursor.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+
+
+def entries(cursor, after_id=0, until=None):
+    """Записи журнала после after_id и не позже until"""
+    query = "SELECT id, ts, table_name, op, row_id, data FROM change_log WHERE id > ?"
+    params = [after_id]
+    if until is not None:
+        query += " AND ts <= ?"
+        params.append(timestamp_bound(until))
+    query += " ORDER BY id"
+    return cursor.execute(query, params)
+
+
+def replay(cursor, log_entries):
+    """Применение записей журнала к базе, возвращает их количество
+
+    На время применения триггеры таблиц снимаются: в записях уже есть
+    значения, которые они вычисляли (last_activity, comment_count,
+    status_date), а в журнал восстанавливаемой базы переносятся сами
+    записи с исходными ID и временем. Триггеры пересоздаются в той же
+    транзакции.
+    """
+    triggers = cursor.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' "
+        f"AND tbl_name IN ({', '.join('?' * len(LOGGED_TABLES))})", LOGGED_TABLES
+    ).fetchall()
+    for name, _sql in triggers:
+        cursor.execute(f"DROP TRIGGER {name}")
+    try:
+        return _apply(cursor, log_entries)
+    finally:
+        for _name, sql in triggers:
+            cursor.execute(sql)
+
+
+def _apply(cursor, log_entries):
+    attached = {row[1] for row in cursor.execute("PRAGMA database_list")}
+    logged = is_enabled(cursor)
+    count = 0
+    for entry in log_entries:
+        _id, _ts, table, op, row_id, data = entry
+        if table in ARCHIVE_LOGGED_TABLES:
+            if 'archive' not in attached:
+                continue
+            # У таблиц архива нет первичного ключа, поэтому UPSERT невозможен
+            cursor.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+            if op != 'D':
+                row = json.loads(data)
+                cursor.execute(
+                    f"INSERT INTO {table} ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                    list(row.values())
+                )
+        elif table not in LOGGED_TABLES:
+            continue
+        elif op == 'D':
+            cursor.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+        else:
+            row = json.loads(data)
+            columns = ", ".join(row)
+            placeholders = ", ".join('?' * len(row))
+            # UPSERT, а не INSERT OR REPLACE: строка меняется на месте, а не
+            # удаляется и вставляется заново
+            updates = ", ".join(f"{column} = excluded.{column}" for column in row if column != 'id')
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES ({placeholders}) "
+                f"ON CONFLICT (id) DO UPDATE SET {updates}",
+                list(row.values())
+            )
+        if logged:
+            cursor.execute(
+                "INSERT OR IGNORE INTO change_log (id, ts, table_name, op, row_id, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)", entry
+            )
+        count += 1
+    return count
@@ -0,0 +1,326 @@
+"""Командная строка TaskFlow
+
+Проекты, задачи и комментарии без графического интерфейса:
+
+    python cli.py project create "Сайт"
+    python cli.py task create "Сайт" "Сверстать главную" --priority высокий
+    python cli.py --json task list "Сайт"
+
+Пакетный режим читает команды (по одной в строке, в том же формате, что
+аргументы командной строки) из файла или stdin и выполняет их в одном
+процессе одной транзакцией: при первой ошибке не применяется ничего.
+
+    python cli.py batch commands.txt
+
+С --workspace (или TASKFLOW_WORKSPACE) команды работают с базой рабочего
+пространства из каталога TASKFLOW_WORKSPACES (см. workspaces.py).
+"""
+
+import argparse
+import json
+import os
+import shlex
+import sys
+from contextlib import ExitStack, contextmanager
+
+from task_manager import TaskManager
+from workspaces import WorkspaceRegistry
+
+
+class CommandError(Exception):
+    """Команда не выполнена"""
+
+
+# Проекты
+def project_create(manager, args):
+    if not manager.create_project(args.name, args.description):
+        raise CommandError(f"Проект уже существует: {args.name}")
+    return find_project(manager, args.name)
+
+
+def project_list(manager, args):
+    return manager.get_all_projects()
+
+
+def project_delete(manager, args):
+    project = find_project(manager, args.project)
+    if not manager.delete_project(project['id']):
+        raise CommandError(f"Не удалось удалить проект: {args.project}")
+    return project
+
+
+# Задачи
+def task_create(manager, args):
+    project = find_project(manager, args.project)
+    if manager.task_exists(args.title, project['id']):
+        raise CommandError(f"Задача уже существует: {args.title}")
+    if not manager.create_task(args.title, project['id'], args.description, args.assignee,
+                               enum_value(args.priority), args.due):
+        raise CommandError(f"Не удалось создать задачу: {args.title}")
+    return {'id': manager.find_task_id(args.title, project['id']),
+            'project_id': project['id'], 'title': args.title}
+
+
+def task_list(manager, args):
+    project = find_project(manager, args.project)
+    tasks = manager.get_tasks_by_project(project['id'], args.archived)
+    if args.status:
+        code = manager.statuses.code(enum_value(args.status))
+        if code is None:
+            raise CommandError(f"Неизвестный статус: {args.status}")
+        tasks = [task for task in tasks if task['status_code'] == code]
+    return tasks
+
+
+def task_status(manager, args):
+    code = manager.statuses.code(enum_value(args.status))
+    if code is None:
+        raise CommandError(f"Неизвестный статус: {args.status}")
+    if not manager.update_task_status(args.task_id, code, args.expect_version):
+        raise CommandError(f"Не удалось изменить статус задачи {args.task_id}"
+                           + (" (версия изменилась)" if args.expect_version is not None else ""))
+    return {'id': args.task_id, 'status': manager.statuses.label(code)}
+
+
+def task_delete(manager, args):
+    if not manager.delete_task(args.task_id, args.expect_version):
+        raise CommandError(f"Не удалось удалить задачу {args.task_id}"
+                           + (" (версия изменилась)" if args.expect_version is not None else ""))
+    return {'id': args.task_id}
+
+
+def task_active(manager, args):
+    project_id = find_project(manager, args.project)['id'] if args.project else None
+    return manager.get_most_active_tasks(args.limit, project_id)
+
+
+def task_archive(manager, args):
+    project_id = find_project(manager, args.project)['id'] if args.project else None
+    return {'archived': manager.archive_completed(args.days, project_id)}
+
+
+# Комментарии
+def comment_add(manager, args):
+    if not manager.add_comment(args.task_id, args.author, args.text, args.reply_to):
+        raise CommandError(f"Не удалось добавить комментарий к задаче {args.task_id}")
+    return {'task_id': args.task_id, 'author': args.author, 'parent_id': args.reply_to}
+
+
+def comment_list(manager, args):
+    return manager.get_comments(args.task_id, args.archived)
+
+
+def comment_delete(manager, args):
+    if not manager.delete_comment(args.comment_id):
+        raise CommandError(f"Комментарий не найден: {args.comment_id}")
+    return {'id': args.comment_id}
+
+
+def find_project(manager, reference):
+    """Проект по ID или названию"""
+    project = manager.find_project(reference)
+    if project is None:
+        raise CommandError(f"Проект не найден: {reference}")
+    return project
+
+
+def enum_value(value):
+    """Код справочника из строки (число, ключ или название)"""
+    return int(value) if value.isdigit() else value
+
+
+def build_parser():
+    """Разбор команд; тот же разбор используется для строк пакетного режима"""
+    parser = argparse.ArgumentParser(prog='taskflow', description="TaskFlow из командной строки")
+    parser.add_argument('--db', default=os.environ.get('TASKFLOW_DB', 'tasks.db'), help="файл базы данных")
+    parser.add_argument('--workspace', default=os.environ.get('TASKFLOW_WORKSPACE'),
+                        help="рабочее пространство вместо --db")
+    parser.add_argument('--json', action='store_true', help="вывод в JSON")
+    objects = parser.add_subparsers(dest='object', required=True)
+
+    project = objects.add_parser('project', help="проекты").add_subparsers(dest='command', required=True)
+    command = project.add_parser('create', help="создать проект")
+    command.add_argument('name')
+    command.add_argument('--description', default="")
+    command.set_defaults(handler=project_create)
+    project.add_parser('list', help="список проектов").set_defaults(handler=project_list)
+    command = project.add_parser('delete', help="удалить проект с задачами")
+    command.add_argument('project', help="ID или название")
+    command.set_defaults(handler=project_delete)
+
+    task = objects.add_parser('task', help="задачи").add_subparsers(dest='command', required=True)
+    command = task.add_parser('create', help="создать задачу")
+    command.add_argument('project', help="ID или название проекта")
+    command.add_argument('title')
+    command.add_argument('--description', default="")
+    command.add_argument('--assignee', default="")
+    command.add_argument('--priority', default="средний")
+    command.add_argument('--due', default=None, help="срок, YYYY-MM-DD")
+    command.set_defaults(handler=task_create)
+    command = task.add_parser('list', help="задачи проекта")
+    command.add_argument('project', help="ID или название проекта")
+    command.add_argument('--status')
+    command.add_argument('--archived', action='store_true', help="вместе с архивными")
+    command.set_defaults(handler=task_list)
+    command = task.add_parser('status', help="изменить статус")
+    command.add_argument('task_id', type=int)
+    command.add_argument('status')
+    command.add_argument('--expect-version', type=int, default=None, help="изменить, только если версия задачи такая")
+    command.set_defaults(handler=task_status)
+    command = task.add_parser('delete', help="удалить задачу")
+    command.add_argument('task_id', type=int)
+    command.add_argument('--expect-version', type=int, default=None, help="удалить, только если версия задачи такая")
+    command.set_defaults(handler=task_delete)
+    command = task.add_parser('active', help="задачи с самой свежей активностью")
+    command.add_argument('--project', help="ID или название проекта")
+    command.add_argument('--limit', type=int, default=20)
+    command.set_defaults(handler=task_active)
+    command = task.add_parser('archive', help="перенести выполненные задачи в архив")
+    command.add_argument('--days', type=int, default=30)
+    command.add_argument('--project', help="ID или название проекта")
+    command.set_defaults(handler=task_archive, archive=True)
+
+    comment = objects.add_parser('comment', help="комментарии").add_subparsers(dest='command', required=True)
+    command = comment.add_parser('add', help="добавить комментарий")
+    command.add_argument('task_id', type=int)
+    command.add_argument('author')
+    command.add_argument('text')
+    command.add_argument('--reply-to', type=int, default=None, help="ID родительского комментария")
+    command.set_defaults(handler=comment_add)
+    command = comment.add_parser('list', help="комментарии задачи")
+    command.add_argument('task_id', type=int)
+    command.add_argument('--archived', action='store_true', help="и для архивной задачи")
+    command.set_defaults(handler=comment_list)
+    command = comment.add_parser('delete', help="удалить комментарий с ответами")
+    command.add_argument('comment_id', type=int)
+    command.set_defaults(handler=comment_delete)
+
+    batch = objects.add_parser('batch', help="выполнить команды из файла одной транзакцией")
+    batch.add_argument('file', nargs='?', default='-', help="файл команд, '-' - stdin")
+    batch.set_defaults(handler=None)
+    return parser
+
+
+def make_manager(db_name, workspace=None):
+    """TaskManager или ShardedTaskManager (TASKFLOW_SHARDS), как в modern_gui
+
+    Возвращает (менеджер, реестр пространств или None); закрываются они
+    через close_manager.
+    """
+    if workspace:
+        registry = WorkspaceRegistry(os.environ.get('TASKFLOW_WORKSPACES', 'workspaces'))
+        try:
+            return registry.get(workspace), registry
+        except (KeyError, ValueError):
+            registry.close()
+            raise
+    if os.environ.get('TASKFLOW_SHARDS'):
+        from sharding import ShardedTaskManager
+        return ShardedTaskManager(
+            os.environ.get('TASKFLOW_SHARD_BASE', 'tasks'), int(os.environ['TASKFLOW_SHARDS'])
+        ), None
+    return TaskManager(db_name), None
+
+
+def close_manager(manager, registry=None):
+    """Закрытие менеджера из make_manager (вместе с реестром пространств)"""
+    if registry is None:
+        manager.close()
+    else:
+        # Реестр останавливает свои потоки и закрывает выданный менеджер
+        registry.close()
+
+
+@contextmanager
+def transaction(manager, archive=False):
+    """Одна транзакция на базу (в шардированном режиме - на каждый шард и каталог)
+
+    Каталог фиксируется последним: если не удалась фиксация шарда, записи
+    о новых проектах откатываются вместе с ним.
+    """
+    with ExitStack() as stack:
+        if hasattr(manager, 'catalog'):
+            stack.enter_context(manager.catalog.transaction())
+        for target in getattr(manager, 'shards', [manager]):
+            # ATTACH архива невозможен внутри транзакции, подключаем заранее
+            if archive or target.archive.exists():
+                target.archive.connect()
+            stack.enter_context(target.db.transaction())
+        yield
+
+
+def print_result(result, as_json, out=sys.stdout):
+    """Вывод результата команды: JSON в одну строку или текстом"""
+    if as_json:
+        out.write(json.dumps(result, ensure_ascii=False) + "\n")
+        return
+    rows = result if isinstance(result, list) else [result]
+    for row in rows:
+        out.write("\t".join("" if value is None else str(value) for value in row.values()) + "\n")
+
+
+def read_commands(parser, source):
+    """Разбор строк пакета заранее, чтобы опечатка не прерывала транзакцию"""
+    commands = []
+    for number, line in enumerate(source, 1):
+        words = shlex.split(line, comments=True)
+        if not words:
+            continue
+        try:
+            args = parser.parse_args(words)
+        except SystemExit:
+            raise CommandError(f"строка {number}: не удалось разобрать команду")
+        if args.handler is None:
+            raise CommandError(f"строка {number}: вложенный batch не поддерживается")
+        commands.append((number, args))
+    return commands
+
+
+def run_batch(manager, parser, args):
+    """Пакетный режим; возвращает количество выполненных команд"""
+    if args.file == '-':
+        commands = read_commands(parser, sys.stdin)
+    else:
+        with open(args.file, encoding='utf-8') as source:
+            commands = read_commands(parser, source)
+
+    # Вывод копится до фиксации транзакции: при ошибке не печатается ничего
+    results = []
+    archive = any(getattr(command, 'archive', False) for _number, command in commands)
+    with transaction(manager, archive):
+        for number, command in commands:
+            try:
+                results.append(command.handler(manager, command))
+            except CommandError as e:
+                raise CommandError(f"строка {number}: {e}")
+    for result in results:
+        print_result(result, args.json)
+    return len(commands)
+
+
+def main(argv=None):
+    """Точка входа командной строки"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        manager, registry = make_manager(args.db, args.workspace)
+    except (KeyError, ValueError) as e:
+        print(f"Ошибка: {e.args[0]}", file=sys.stderr)
+        return 1
+    try:
+        if args.handler is None:
+            count = run_batch(manager, parser, args)
+            if not args.json:
+                print(f"Выполнено команд: {count}", file=sys.stderr)
+        else:
+            print_result(args.handler(manager, args), args.json)
+        return 0
+    except CommandError as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    finally:
+        close_manager(manager, registry)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
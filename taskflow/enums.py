@@ -0,0 +1,112 @@
+"""Справочники статусов и приоритетов задач
+
+Задачи хранят небольшие целочисленные коды, а отображаемые названия,
+порядок сортировки и переводы лежат в таблицах-справочниках.
+"""
+
+DEFAULT_LOCALE = 'ru'
+
+
+class Enumeration:
+    """Справочник значений с целочисленными кодами"""
+
+    def __init__(self, table, items):
+        # items: [(код, ключ, порядок, {локаль: название}), ...]
+        self.table = table
+        self.items = sorted(items, key=lambda item: item[2])
+        self._by_value = {}
+        for code, key, _order, labels in self.items:
+            self._by_value[code] = code
+            self._by_value[str(code)] = code
+            self._by_value[key] = code
+            for label in labels.values():
+                self._by_value[label.lower()] = code
+
+    @classmethod
+    def load(cls, db, table):
+        """Загрузка справочника из базы данных"""
+        rows = db.fetch_all(
+            f"""SELECT e.id, e.key, e.sort_order, l.locale, l.label
+                FROM {table} e
+                LEFT JOIN enum_labels l ON l.enum = ? AND l.code = e.id
+                ORDER BY e.sort_order""",
+            (table,)
+        )
+        items = {}
+        for code, key, order, locale, label in rows:
+            item = items.setdefault(code, (code, key, order, {}))
+            if locale:
+                item[3][locale] = label
+        return cls(table, list(items.values()))
+
+    def code(self, value):
+        """Код по коду, ключу или названию на любом языке"""
+        if isinstance(value, str):
+            value = value.strip().lower()
+        return self._by_value.get(value)
+
+    def label(self, code, locale=DEFAULT_LOCALE):
+        """Отображаемое название по коду"""
+        for item_code, key, _order, labels in self.items:
+            if item_code == code:
+                return labels.get(locale) or labels.get(DEFAULT_LOCALE) or key
+        return code
+
+    def labels(self, locale=DEFAULT_LOCALE):
+        """Список названий в порядке сортировки"""
+        return [self.label(item[0], locale) for item in self.items]
+
+    def codes(self):
+        """Список кодов в порядке сортировки"""
+        return [item[0] for item in self.items]
+
+
+# Значения по умолчанию, которыми заполняются справочники
+STATUSES = Enumeration('statuses', [
+    (1, 'todo', 1, {'ru': 'к выполнению', 'en': 'to do'}),
+    (2, 'in_progress', 2, {'ru': 'в работе', 'en': 'in progress'}),
+    (3, 'review', 3, {'ru': 'на проверке', 'en': 'in review'}),
+    (4, 'done', 4, {'ru': 'выполнено', 'en': 'done'}),
+])
+
+PRIORITIES = Enumeration('priorities', [
+    (1, 'low', 1, {'ru': 'низкий', 'en': 'low'}),
+    (2, 'medium', 2, {'ru': 'средний', 'en': 'medium'}),
+    (3, 'high', 3, {'ru': 'высокий', 'en': 'high'}),
+])
+
+STATUS_TODO = 1
+STATUS_DONE = 4
+PRIORITY_MEDIUM = 2
+
+
+def seed_enumerations(cursor):
+    """Создание и заполнение таблиц-справочников"""
+    for enum in (STATUSES, PRIORITIES):
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {enum.table} (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                sort_order INTEGER NOT NULL
+            )
+        ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS enum_labels (
+            enum TEXT NOT NULL,
+            code INTEGER NOT NULL,
+            locale TEXT NOT NULL,
+            label TEXT NOT NULL,
+            PRIMARY KEY (enum, code, locale)
+        ) WITHOUT ROWID
+    ''')
+    for enum in (STATUSES, PRIORITIES):
+        for code, key, order, labels in enum.items:
+            cursor.execute(
+                f"INSERT OR IGNORE INTO {enum.table} (id, key, sort_order) VALUES (?, ?, ?)",
+                (code, key, order)
+            )
+            for locale, label in labels.items():
+                cursor.execute(
+                    "INSERT OR IGNORE INTO enum_labels (enum, code, locale, label) VALUES (?, ?, ?, ?)",
+                    (enum.table, code, locale, label)
+                )
@@ -0,0 +1,320 @@
+"""Нагрузочный тест обработчиков ModernTaskManagerGUI
+
+Заполняет базу заданного размера и в цикле выполняет действия
+пользователя: выбор проекта, создание задачи, смену статуса и добавление
+комментария. Каждое действие повторяет работу с базой, которую делает
+соответствующий обработчик интерфейса (вместе с обновлением списков после
+него). Обработчики выполняются в потоке Tk, поэтому длительность действия -
+это время, на которое интерфейс перестаёт отвечать. Измеряются длительности
+действий и обновлений каждой таблицы и рост памяти за сессию; в конце
+выводится отчёт.
+
+    python loadtest.py --projects 20 --tasks 5000 --iterations 200 --report report.json
+
+Отрисовка Treeview в замеры не входит: окно интерфейса не создаётся, и тест
+не требует дисплея.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+# Длительность действия, начиная с которой интерфейс считается зависшим (мс)
+FREEZE_MS = 200
+
+ASSIGNEES = ['Анна', 'Борис', 'Вера', 'Глеб', 'Дина', 'Егор', '']
+
+
+def populate(db_name, projects, tasks_per_project, comments_per_task, seed=1):
+    """Заполнение базы тестовыми проектами, задачами и комментариями"""
+    from task_manager import TaskManager, PREVIEW_LENGTH
+
+    rng = random.Random(seed)
+    manager = TaskManager(db_name)
+    statuses = manager.statuses.codes()
+    priorities = manager.priorities.codes()
+    with manager.db.transaction() as conn:
+        for number in range(projects):
+            conn.execute(
+                "INSERT INTO projects (name, description) VALUES (?, ?)",
+                (f"Проект {number + 1}", "Создан нагрузочным тестом")
+            )
+        project_ids = [row[0] for row in conn.execute("SELECT id FROM projects")]
+        for project_id in project_ids:
+            conn.executemany(
+                """INSERT INTO tasks (title, description, status, priority, project_id, assignee, created_date)
+                   VALUES (?, ?, ?, ?, ?, ?, datetime('now', ?))""",
+                ((f"Задача {number + 1}", "Описание задачи " * 5, rng.choice(statuses),
+                  rng.choice(priorities), project_id, rng.choice(ASSIGNEES), f"-{number} minutes")
+                 for number in range(tasks_per_project))
+            )
+        if comments_per_task:
+            texts = [f"Комментарий {number}: " + "текст " * rng.randint(5, 60) for number in range(50)]
+            task_ids = [row[0] for row in conn.execute("SELECT id FROM tasks")]
+            # Тексты выбираются с повторами: комментариев может быть больше, чем текстов
+            conn.executemany(
+                "INSERT INTO comments (task_id, author, text, preview, length) VALUES (?, ?, ?, ?, ?)",
+                ((task_id, rng.choice(ASSIGNEES) or 'Гость', text, text[:PREVIEW_LENGTH], len(text))
+                 for task_id in task_ids
+                 for text in rng.choices(texts, k=comments_per_task))
+            )
+    manager.close()
+
+
+class Timings:
+    """Длительности вызовов (мс)"""
+
+    def __init__(self):
+        self.samples = {}
+
+    def measure(self, label, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.samples.setdefault(label, []).append((time.perf_counter() - started) * 1000)
+
+
+def memory_usage():
+    """Резидентная память процесса в байтах"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        # ru_maxrss - пиковое значение (КБ в Linux, байты в macOS)
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def summarize(values):
+    """Количество, среднее и процентили ряда значений"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def percentile(share):
+        return round(ordered[min(int(len(ordered) * share), len(ordered) - 1)], 2)
+
+    return {
+        'count': len(ordered),
+        'mean': round(sum(ordered) / len(ordered), 2),
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'p99': percentile(0.99),
+        'max': round(ordered[-1], 2),
+    }
+
+
+class ActionDriver:
+    """Сценарий пользователя: те же вызовы менеджера, что у обработчиков интерфейса"""
+
+    STEPS = ('select_project', 'create_task', 'update_status', 'add_comment')
+
+    def __init__(self, manager, iterations, duration=None, seed=1):
+        self.manager = manager
+        self.iterations = iterations
+        self.deadline = time.monotonic() + duration if duration else None
+        self.rng = random.Random(seed)
+        self.timings = Timings()
+        self.memory = []
+        self.iteration = 0
+        self.created = 0
+        self.projects = []
+        self.project_id = None
+        self.tasks_shown = []
+        self.all_tasks = []
+
+    def start(self):
+        """Загрузка списков при запуске интерфейса; возвращает длительность (мс)"""
+        started = time.perf_counter()
+        self.refresh_projects()
+        self.refresh_all_tasks()
+        return (time.perf_counter() - started) * 1000
+
+    def run(self):
+        """Выполнение сценария до конца итераций или времени"""
+        self.memory.append(memory_usage())
+        while not self.finished():
+            for name in self.STEPS:
+                self.timings.measure(f"step:{name}", getattr(self, name))
+            self.iteration += 1
+            self.memory.append(memory_usage())
+
+    def finished(self):
+        if self.deadline is not None:
+            return time.monotonic() >= self.deadline
+        return self.iteration >= self.iterations
+
+    # Обновление таблиц (как одноимённые методы интерфейса)
+    def refresh_projects(self):
+        self.projects = self.timings.measure('refresh_projects (projects_tree)', self.manager.get_all_projects)
+
+    def refresh_all_tasks(self):
+        from modern_gui import ALL_TASKS_COLUMNS
+
+        self.all_tasks = self.timings.measure(
+            'refresh_all_tasks (comments_tasks_tree)',
+            lambda: list(self.manager.iter_all_tasks(ALL_TASKS_COLUMNS))
+        )
+
+    def refresh_tasks(self, project_id):
+        self.timings.measure('refresh_tasks (tasks_tree)', self._load_tasks, project_id)
+
+    def _load_tasks(self, project_id):
+        from modern_gui import GROUP_CHOICES, IN_MEMORY_TASKS_LIMIT, TASKS_PAGE_SIZE
+        from task_filter import TaskFilter, TaskIndex
+
+        self.project_id = project_id
+        task_filter = TaskFilter(group_by=self.rng.choice(list(GROUP_CHOICES.values())))
+        if self.manager.count_tasks(project_id) <= IN_MEMORY_TASKS_LIMIT:
+            self.tasks_shown = TaskIndex(self.manager.get_tasks_by_project(project_id)).query(task_filter)
+        else:
+            self.tasks_shown = self.manager.query_tasks(project_id, task_filter, limit=TASKS_PAGE_SIZE)
+            self.manager.count_task_groups(project_id, task_filter)
+
+    def refresh_comments(self, task_id):
+        from task_manager import COMMENTS_PAGE_SIZE
+
+        self.timings.measure(
+            'refresh_comments (comments_tree)',
+            lambda: (self.manager.get_comment_previews(task_id, None, COMMENTS_PAGE_SIZE + 1, 0),
+                     self.manager.get_task(task_id))
+        )
+
+    # Действия пользователя
+    def select_project(self):
+        if self.projects:
+            self.refresh_tasks(self.rng.choice(self.projects)['id'])
+
+    def create_task(self):
+        if self.project_id is None:
+            return
+        self.created += 1
+        title = f"Нагрузка {os.getpid()}-{self.created}"
+        if self.manager.task_exists(title, self.project_id):
+            return
+        priority = self.rng.choice(self.manager.get_priorities())
+        if self.manager.create_task(title, self.project_id, "", self.rng.choice(ASSIGNEES), priority, ""):
+            self.refresh_tasks(self.project_id)
+            self.refresh_all_tasks()
+
+    def update_status(self):
+        if not self.tasks_shown:
+            return
+        task = self.rng.choice(self.tasks_shown[:100])
+        self.manager.update_task_status(task['id'], self.rng.choice(self.manager.get_statuses()))
+        self.refresh_tasks(self.project_id)
+
+    def add_comment(self):
+        if not self.all_tasks:
+            return
+        # Строки iter_all_tasks - кортежи ALL_TASKS_COLUMNS, ID первый
+        task_id = self.rng.choice(self.all_tasks[:100])[0]
+        self.manager.add_comment(task_id, "Нагрузочный тест", "Комментарий " * self.rng.randint(1, 40))
+        self.refresh_comments(task_id)
+
+
+def run(args):
+    """Подготовка базы, выполнение сценария и сбор отчёта"""
+    from task_manager import TaskManager
+
+    if args.fresh and os.path.exists(args.db):
+        os.remove(args.db)
+    if not os.path.exists(args.db):
+        started = time.perf_counter()
+        populate(args.db, args.projects, args.tasks, args.comments, args.seed)
+        print(f"База заполнена за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+    if args.tracemalloc:
+        tracemalloc.start(10)
+    manager = TaskManager(args.db)
+    try:
+        driver = ActionDriver(manager, args.iterations, args.duration, args.seed)
+        startup_ms = driver.start()
+        snapshot = tracemalloc.take_snapshot() if args.tracemalloc else None
+        session_started = time.perf_counter()
+        driver.run()
+        session_s = time.perf_counter() - session_started
+
+        top_allocations = []
+        if snapshot is not None:
+            stats = tracemalloc.take_snapshot().compare_to(snapshot, 'lineno')
+            top_allocations = [str(stat) for stat in stats[:10]]
+    finally:
+        manager.close()
+
+    steps = [value for name, values in driver.timings.samples.items()
+             if name.startswith('step:') for value in values]
+    memory = driver.memory
+    return {
+        'config': {
+            'db': args.db, 'projects': args.projects, 'tasks_per_project': args.tasks,
+            'comments_per_task': args.comments, 'iterations': driver.iteration,
+        },
+        'startup_ms': round(startup_ms, 1),
+        'session_s': round(session_s, 1),
+        'freezes': sum(1 for duration in steps if duration >= FREEZE_MS),
+        'timings_ms': {name: summarize(values) for name, values in sorted(driver.timings.samples.items())},
+        'memory': {
+            'start_mb': round(memory[0] / 2 ** 20, 1),
+            'end_mb': round(memory[-1] / 2 ** 20, 1),
+            'peak_mb': round(max(memory) / 2 ** 20, 1),
+            'growth_mb': round((memory[-1] - memory[0]) / 2 ** 20, 1),
+            'growth_per_iteration_kb': round((memory[-1] - memory[0]) / 1024 / max(len(memory) - 1, 1), 1),
+        },
+        'top_allocations': top_allocations,
+    }
+
+
+def print_report(report, out=sys.stdout):
+    """Отчёт в текстовом виде"""
+    config = report['config']
+    out.write(f"Проектов: {config['projects']}, задач в проекте: {config['tasks_per_project']}, "
+              f"итераций: {config['iterations']}\n")
+    out.write(f"Запуск: {report['startup_ms']} мс, сессия: {report['session_s']} с, "
+              f"действий дольше {FREEZE_MS} мс: {report['freezes']}\n")
+    out.write("Длительности (мс):\n")
+    for name, stats in report['timings_ms'].items():
+        if stats['count']:
+            out.write(f"  {name:<45} n={stats['count']:<5} p50={stats['p50']:<9} "
+                      f"p95={stats['p95']:<9} max={stats['max']}\n")
+    memory = report['memory']
+    out.write(f"Память: {memory['start_mb']} -> {memory['end_mb']} МБ (пик {memory['peak_mb']}, "
+              f"{memory['growth_per_iteration_kb']} КБ на итерацию)\n")
+    for line in report['top_allocations']:
+        out.write(f"  {line}\n")
+
+
+def main():
+    """Запуск нагрузочного теста из командной строки"""
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков интерфейса TaskFlow")
+    parser.add_argument('--db', default='loadtest.db')
+    parser.add_argument('--fresh', action='store_true', help="пересоздать базу")
+    parser.add_argument('--projects', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=1000, help="задач в проекте")
+    parser.add_argument('--comments', type=int, default=2, help="комментариев на задачу")
+    parser.add_argument('--iterations', type=int, default=50, help="повторов сценария")
+    parser.add_argument('--duration', type=float, default=None, help="длительность сессии в секундах")
+    parser.add_argument('--tracemalloc', action='store_true', help="места роста памяти (медленнее)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--report', help="файл для отчёта в JSON")
+    args = parser.parse_args()
+    if min(args.projects, args.tasks, args.comments) < 0:
+        parser.error("количество проектов, задач и комментариев не может быть отрицательным")
+
+    report = run(args)
+    print_report(report)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as out:
+            json.dump(report, out, ensure_ascii=False, indent=2)
+    # Ненулевой код при зависаниях, чтобы тест можно было запускать в CI
+    return 1 if report['freezes'] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,12 +1,62 @@
+import os
+import queue
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
-from task_manager import TaskManager
+from task_manager import TaskManager, COMMENTS_PAGE_SIZE
+from enums import PRIORITY_MEDIUM
+from startup_timer import StartupTimer
+from backup import BackupManager
+from task_filter import TaskFilter, TaskIndex, group_tasks, DEFAULT_ORDER
+
+# Сколько строк вставлять в таблицу за один шаг при фоновой загрузке
+PROGRESSIVE_CHUNK = 200
+
+# Проекты до этого размера фильтруются в памяти, большие - запросами к БД
+IN_MEMORY_TASKS_LIMIT = 2000
+TASKS_PAGE_SIZE = 1000
+FILTER_DEBOUNCE_MS = 300
+MAX_SORT_KEYS = 3
+
+# Столбцы списка задач на вкладке комментариев
+ALL_TASKS_COLUMNS = ('id', 'title', 'project_name', 'comment_count')
+
+CONFLICT_MESSAGE = "Запись уже изменена или удалена другим пользователем. Данные обновлены."
+
+FILTER_ALL = 'все'
+GROUP_CHOICES = {'нет': None, 'по статусу': 'status', 'по исполнителю': 'assignee'}
+TASK_SORT_COLUMNS = {
+    'ID': 'id',
+    'Title': 'title',
+    'Status': 'status',
+    'Assignee': 'assignee',
+    'Priority': 'priority',
+    'Comments': 'comment_count',
+    'Activity': 'last_activity',
+}
 
 class ModernTaskManagerGUI:
     """Современный интерфейс системы управления задачами"""
     
-    def __init__(self, root):
+    def __init__(self, root, manager=None, lazy=False, timer=None):
         self.root = root
+        self.lazy = lazy
+        self.timer = timer or StartupTimer()
+        self.built_tabs = set()
+        self.projects_cache = []
+        self.all_tasks_cache = []
+        self._fill_tokens = {}
+        self.tasks_project_id = None
+        self.tasks_index = None
+        self.tasks_filter = None
+        self.tasks_shown = []
+        self.tasks_counts = None
+        self.task_versions = {}
+        self.tasks_sort = list(DEFAULT_ORDER)
+        self._filter_job = None
+        self.reply_to_id = None
+        self.comment_pages = {}
+        self.comment_versions = {}
         self.root.title("TaskFlow • Современный менеджер задач")
         self.root.geometry("1200x750")
         
@@ -35,10 +85,18 @@ class ModernTaskManagerGUI:
         self.root.configure(bg=self.colors['bg_primary'])
         self.setup_styles()
         
-        self.manager = TaskManager()
+        self.manager = manager or TaskManager()
+        self.timer.mark('database')
         self.setup_ui()
-        self.refresh_projects()
-        self.refresh_all_tasks()
+        self.timer.mark('ui')
+        
+        if self.lazy:
+            # Сначала показываем окно, данные догружаются в фоне
+            self.root.bind('<Map>', self.on_first_map, add='+')
+        else:
+            self.refresh_projects()
+            self.refresh_all_tasks()
+            self.timer.mark('data')
         
         # Адаптивность
         self.root.bind('<Configure>', self.on_resize)
@@ -144,6 +202,11 @@ class ModernTaskManagerGUI:
             action_frame, "➕ Проект", 
             self.show_create_project, self.colors['accent_green']
         ).pack(side='left', padx=5)
+        
+        self.create_modern_button(
+            action_frame, "💾 Копия", 
+            self.create_backup, self.colors['primary']
+        ).pack(side='left', padx=5)
     
     def setup_tabs(self, parent):
         """Настройка системы вкладок"""
@@ -153,17 +216,46 @@ class ModernTaskManagerGUI:
         # Вкладка проектов
         self.projects_frame = tk.Frame(self.notebook, bg=self.colors['bg_primary'])
         self.notebook.add(self.projects_frame, text="📁 Проекты")
-        self.setup_projects_tab()
         
         # Вкладка задач
         self.tasks_frame = tk.Frame(self.notebook, bg=self.colors['bg_primary'])
         self.notebook.add(self.tasks_frame, text="✅ Задачи")
-        self.setup_tasks_tab()
         
         # Вкладка комментариев
         self.comments_frame = tk.Frame(self.notebook, bg=self.colors['bg_primary'])
         self.notebook.add(self.comments_frame, text="💬 Комментарии")
-        self.setup_comments_tab()
+        
+        # Построение и заполнение каждой вкладки
+        self.tab_builders = {
+            str(self.projects_frame): (self.setup_projects_tab, self.populate_projects_tab),
+            str(self.tasks_frame): (self.setup_tasks_tab, self.populate_tasks_tab),
+            str(self.comments_frame): (self.setup_comments_tab, self.populate_comments_tab),
+        }
+        
+        if self.lazy:
+            # Открытая вкладка строится сразу, остальные - при первом переходе
+            self.build_tab(self.projects_frame)
+            self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
+        else:
+            for frame in (self.projects_frame, self.tasks_frame, self.comments_frame):
+                self.build_tab(frame)
+    
+    def build_tab(self, frame):
+        """Построение вкладки, если она ещё не построена"""
+        if self.is_tab_built(frame):
+            return
+        setup, populate = self.tab_builders[str(frame)]
+        setup()
+        self.built_tabs.add(str(frame))
+        populate(progressive=self.lazy)
+    
+    def is_tab_built(self, frame):
+        """Проверка, построена ли вкладка"""
+        return str(frame) in self.built_tabs
+    
+    def on_tab_changed(self, event):
+        """Обработчик переключения вкладки"""
+        self.build_tab(self.notebook.select())
     
     def setup_projects_tab(self):
         """Вкладка управления проектами с улучшенной видимостью"""
@@ -288,8 +380,8 @@ class ModernTaskManagerGUI:
                 if attr == 'project_combo':
                     widget.set("Выберите проект")
                 elif attr == 'task_priority':
-                    widget['values'] = ['низкий', 'средний', 'высокий']
-                    widget.set('средний')
+                    widget['values'] = self.manager.get_priorities()
+                    widget.set(self.manager.priorities.label(PRIORITY_MEDIUM))
             
             setattr(self, attr, widget)
             widget.pack(fill='x', pady=(0, 15))
@@ -303,13 +395,51 @@ class ModernTaskManagerGUI:
         manage_card = self.create_modern_card(right_frame, "Управление задачами", "Список задач проекта")
         manage_card.pack(fill='both', expand=True)
         
+        # Панель фильтров
+        filter_frame = tk.Frame(manage_card, bg=self.colors['bg_card'])
+        filter_frame.pack(fill='x')
+        
+        filters = [
+            ("Статус", "filter_status", [FILTER_ALL] + self.manager.get_statuses()),
+            ("Приоритет", "filter_priority", [FILTER_ALL] + self.manager.get_priorities()),
+            ("Группировка", "filter_group", list(GROUP_CHOICES)),
+        ]
+        
+        for column, (label, attr, values) in enumerate(filters):
+            tk.Label(filter_frame, text=label + ":", 
+                    font=('Segoe UI', 9), fg=self.colors['text_secondary'],
+                    bg=self.colors['bg_card']).grid(row=0, column=column, sticky='w', padx=(0, 10))
+            widget = ttk.Combobox(filter_frame, values=values, state='readonly',
+                                  font=('Segoe UI', 10), style='Modern.TCombobox')
+            widget.set(values[0])
+            widget.grid(row=1, column=column, sticky='ew', padx=(0, 10), pady=(0, 8))
+            widget.bind('<<ComboboxSelected>>', self.schedule_task_filter)
+            setattr(self, attr, widget)
+        
+        text_filters = [
+            ("Исполнитель", "filter_assignee"),
+            ("Поиск по названию", "filter_text"),
+        ]
+        
+        for column, (label, attr) in enumerate(text_filters):
+            tk.Label(filter_frame, text=label + ":", 
+                    font=('Segoe UI', 9), fg=self.colors['text_secondary'],
+                    bg=self.colors['bg_card']).grid(row=2, column=column, sticky='w', padx=(0, 10))
+            widget = self.create_modern_entry(filter_frame)
+            widget.grid(row=3, column=column, sticky='ew', padx=(0, 10))
+            widget.winfo_children()[0].bind('<KeyRelease>', self.schedule_task_filter)
+            setattr(self, attr, widget)
+        
+        for column in range(len(filters)):
+            filter_frame.columnconfigure(column, weight=1)
+        
         # Таблица задач с улучшенной видимостью
         tree_frame = tk.Frame(manage_card, bg=self.colors['bg_card'])
         tree_frame.pack(fill='both', expand=True, pady=(15, 0))
         
         self.tasks_tree = ttk.Treeview(
             tree_frame,
-            columns=('ID', 'Title', 'Status', 'Assignee', 'Priority'),
+            columns=('ID', 'Title', 'Status', 'Assignee', 'Priority', 'Comments', 'Activity'),
             show='headings',
             height=10
         )
@@ -322,12 +452,21 @@ class ModernTaskManagerGUI:
             ('Title', 'ЗАДАЧА', 200),
             ('Status', 'СТАТУС', 120),
             ('Assignee', 'ИСПОЛНИТЕЛЬ', 120),
-            ('Priority', 'ПРИОРИТЕТ', 100)
+            ('Priority', 'ПРИОРИТЕТ', 100),
+            ('Comments', '💬', 50),
+            ('Activity', 'АКТИВНОСТЬ', 130)
         ]
         
+        self.tasks_headings = {}
         for col, text, width in task_columns:
-            self.tasks_tree.heading(col, text=text)
-            self.tasks_tree.column(col, width=width, anchor='center' if col == 'ID' else 'w')
+            self.tasks_headings[col] = text
+            self.tasks_tree.heading(col, text=text,
+                                    command=lambda c=col: self.on_tasks_heading_click(c))
+            self.tasks_tree.column(col, width=width, anchor='center' if col in ('ID', 'Comments') else 'w')
+        
+        # Колонка дерева видна только при группировке
+        self.tasks_tree.column('#0', width=160)
+        self.update_tasks_headings()
         
         scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tasks_tree.yview)
         self.tasks_tree.configure(yscrollcommand=scrollbar.set)
@@ -335,6 +474,17 @@ class ModernTaskManagerGUI:
         self.tasks_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
         
+        # Большие проекты загружаются страницами
+        page_frame = tk.Frame(manage_card, bg=self.colors['bg_card'])
+        page_frame.pack(fill='x', pady=(8, 0))
+        self.tasks_page_label = tk.Label(page_frame, text="",
+                                         font=('Segoe UI', 9), fg=self.colors['text_secondary'],
+                                         bg=self.colors['bg_card'])
+        self.tasks_page_label.pack(side='left')
+        self.tasks_more_button = self.create_modern_button(
+            page_frame, "Загрузить ещё", self.load_more_tasks, self.colors['primary']
+        )
+        
         # Панель управления с улучшенным дизайном
         control_frame = tk.Frame(manage_card, bg=self.colors['bg_card'])
         control_frame.pack(fill='x', pady=(15, 0))
@@ -344,7 +494,7 @@ class ModernTaskManagerGUI:
                 bg=self.colors['bg_card']).pack(side='left', padx=(0, 10))
         
         self.status_combo = ttk.Combobox(control_frame, 
-                                       values=['к выполнению', 'в работе', 'на проверке', 'выполнено'],
+                                       values=self.manager.get_statuses(),
                                        width=18,
                                        font=('Segoe UI', 10),
                                        style='Modern.TCombobox')
@@ -390,7 +540,7 @@ class ModernTaskManagerGUI:
         
         self.comments_tasks_tree = ttk.Treeview(
             tree_frame,
-            columns=('ID', 'Title', 'Project'),
+            columns=('ID', 'Title', 'Project', 'Comments'),
             show='headings',
             height=15
         )
@@ -400,12 +550,13 @@ class ModernTaskManagerGUI:
         columns_config = [
             ('ID', 'ID', 80),
             ('Title', 'ЗАДАЧА', 150),
-            ('Project', 'ПРОЕКТ', 100)
+            ('Project', 'ПРОЕКТ', 100),
+            ('Comments', '💬', 50)
         ]
         
         for col, text, width in columns_config:
             self.comments_tasks_tree.heading(col, text=text)
-            self.comments_tasks_tree.column(col, width=width, anchor='center' if col == 'ID' else 'w')
+            self.comments_tasks_tree.column(col, width=width, anchor='center' if col in ('ID', 'Comments') else 'w')
         
         scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.comments_tasks_tree.yview)
         self.comments_tasks_tree.configure(yscrollcommand=scrollbar.set)
@@ -455,10 +606,24 @@ class ModernTaskManagerGUI:
         )
         self.comment_text.pack(fill='both', expand=True, padx=1, pady=1)
         
+        # Индикатор ответа на комментарий
+        self.reply_label = tk.Label(comments_card, text="", 
+                                    font=('Segoe UI', 9), fg=self.colors['text_muted'],
+                                    bg=self.colors['bg_card'])
+        self.reply_label.pack(anchor='w', pady=(0, 5))
+        
+        comment_actions = tk.Frame(comments_card, bg=self.colors['bg_card'])
+        comment_actions.pack(pady=(0, 20))
+        
         self.create_modern_button(
-            comments_card, "💬 Добавить комментарий", 
+            comment_actions, "💬 Добавить комментарий", 
             self.add_comment, self.colors['accent_green']
-        ).pack(pady=(0, 20))
+        ).pack(side='left', padx=(0, 10))
+        
+        self.create_modern_button(
+            comment_actions, "↩️ Ответить", 
+            self.reply_to_comment, self.colors['primary']
+        ).pack(side='left')
         
         # Список комментариев
         tk.Label(comments_card, text="История комментариев:", 
@@ -468,10 +633,11 @@ class ModernTaskManagerGUI:
         comments_list_frame = tk.Frame(comments_card, bg=self.colors['bg_card'])
         comments_list_frame.pack(fill='both', expand=True, pady=(10, 0))
         
+        # Дерево веток: ответы подгружаются при раскрытии комментария
         self.comments_tree = ttk.Treeview(
             comments_list_frame,
             columns=('ID', 'Author', 'Text', 'Date'),
-            show='headings',
+            show='tree headings',
             height=8
         )
         
@@ -487,6 +653,7 @@ class ModernTaskManagerGUI:
         for col, text, width in comment_columns:
             self.comments_tree.heading(col, text=text)
             self.comments_tree.column(col, width=width, anchor='center' if col == 'ID' else 'w')
+        self.comments_tree.column('#0', width=60, stretch=False)
         
         scrollbar = ttk.Scrollbar(comments_list_frame, orient="vertical", command=self.comments_tree.yview)
         self.comments_tree.configure(yscrollcommand=scrollbar.set)
@@ -494,6 +661,28 @@ class ModernTaskManagerGUI:
         self.comments_tree.pack(side='left', fill='both', expand=True)
         scrollbar.pack(side='right', fill='y')
         
+        # Полный текст выбранного комментария загружается только при открытии
+        body_frame = tk.Frame(comments_card, bg=self.colors['bg_input'], relief='flat', borderwidth=1)
+        body_frame.pack(fill='x', pady=(10, 0))
+        
+        self.comment_body = tk.Text(
+            body_frame,
+            height=4,
+            bg=self.colors['bg_input'],
+            fg=self.colors['text_secondary'],
+            font=('Segoe UI', 10),
+            relief='flat',
+            borderwidth=0,
+            padx=12,
+            pady=8,
+            wrap='word',
+            state='disabled'
+        )
+        self.comment_body.pack(fill='both', expand=True, padx=1, pady=1)
+        
+        self.comments_tree.bind('<<TreeviewSelect>>', self.on_comment_selected)
+        self.comments_tree.bind('<<TreeviewOpen>>', self.on_comment_opened)
+        
         # Кнопка удаления комментария
         self.create_modern_button(
             comments_card, "🗑️ Удалить комментарий", 
@@ -597,23 +786,103 @@ class ModernTaskManagerGUI:
     # Бизнес-логика (остается без изменений)
     def refresh_projects(self):
         """Обновление списка проектов"""
-        projects = self.manager.get_all_projects()
-        self.project_combo['values'] = [f"{p['id']}: {p['name']}" for p in projects]
-        
-        self.projects_tree.delete(*self.projects_tree.get_children())
-        for project in projects:
-            self.projects_tree.insert('', 'end', values=(
-                project['id'], project['name'], project['description']
-            ))
+        self.projects_cache = self.manager.get_all_projects()
+        self.populate_projects_tab()
+        self.populate_tasks_tab()
     
     def refresh_all_tasks(self):
         """Обновление всех задач для комментариев"""
-        tasks = self.manager.get_all_tasks()
-        self.comments_tasks_tree.delete(*self.comments_tasks_tree.get_children())
-        for task in tasks:
-            self.comments_tasks_tree.insert('', 'end', values=(
-                task[0], task[1], task[8]  # ID, Title, Project Name
-            ))
+        self.all_tasks_cache = list(self.manager.iter_all_tasks(ALL_TASKS_COLUMNS))
+        self.populate_comments_tab()
+    
+    def populate_projects_tab(self, progressive=False):
+        """Заполнение таблицы проектов из кэша"""
+        if not self.is_tab_built(self.projects_frame):
+            return
+        rows = [(p['id'], p['name'], p['description']) for p in self.projects_cache]
+        self.fill_tree(self.projects_tree, rows, progressive)
+    
+    def populate_tasks_tab(self, progressive=False):
+        """Заполнение списка проектов на вкладке задач из кэша"""
+        if not self.is_tab_built(self.tasks_frame):
+            return
+        self.project_combo['values'] = [f"{p['id']}: {p['name']}" for p in self.projects_cache]
+    
+    def populate_comments_tab(self, progressive=False):
+        """Заполнение списка задач на вкладке комментариев из кэша"""
+        if not self.is_tab_built(self.comments_frame):
+            return
+        self.fill_tree(self.comments_tasks_tree, self.all_tasks_cache, progressive)
+    
+    def fill_tree(self, tree, rows, progressive=False):
+        """Заполнение таблицы строками, при необходимости порциями"""
+        token = self._fill_tokens.get(str(tree), 0) + 1
+        self._fill_tokens[str(tree)] = token
+        tree.delete(*tree.get_children())
+        
+        if not progressive:
+            for values in rows:
+                tree.insert('', 'end', values=values)
+            return
+        
+        def insert_chunk(start):
+            # Более новое заполнение таблицы отменяет текущее
+            if self._fill_tokens.get(str(tree)) != token:
+                return
+            for values in rows[start:start + PROGRESSIVE_CHUNK]:
+                tree.insert('', 'end', values=values)
+            if start + PROGRESSIVE_CHUNK < len(rows):
+                self.root.after(1, insert_chunk, start + PROGRESSIVE_CHUNK)
+        
+        insert_chunk(0)
+    
+    # Отложенная загрузка данных
+    def on_first_map(self, event):
+        """Первое отображение окна: запуск фоновой загрузки"""
+        if event.widget is not self.root:
+            return
+        self.root.unbind('<Map>')
+        self.root.after_idle(self.start_background_load)
+    
+    def start_background_load(self):
+        """Загрузка проектов и задач в отдельном потоке"""
+        self.timer.mark('first_paint')
+        self._load_queue = queue.Queue()
+        
+        def load():
+            try:
+                self._load_queue.put(('projects', self.manager.get_all_projects()))
+                self._load_queue.put(('tasks', list(self.manager.iter_all_tasks(ALL_TASKS_COLUMNS))))
+            except Exception as e:
+                self._load_queue.put(('error', e))
+        
+        threading.Thread(target=load, daemon=True).start()
+        self.root.after(20, self.poll_background_load)
+    
+    def poll_background_load(self):
+        """Применение результатов фоновой загрузки в потоке интерфейса"""
+        # Tk не потокобезопасен, поэтому виджеты обновляются только здесь
+        while True:
+            try:
+                kind, data = self._load_queue.get_nowait()
+            except queue.Empty:
+                self.root.after(20, self.poll_background_load)
+                return
+            
+            if kind == 'projects':
+                self.projects_cache = data
+                self.populate_projects_tab(progressive=True)
+                self.populate_tasks_tab()
+                self.timer.mark('projects_loaded')
+            elif kind == 'tasks':
+                self.all_tasks_cache = data
+                self.populate_comments_tab(progressive=True)
+                self.timer.mark('tasks_loaded')
+                self.timer.emit()
+                return
+            else:
+                messagebox.showerror("Ошибка", f"Не удалось загрузить данные: {data}")
+                return
     
     def on_project_selected(self, event):
         """Обработчик выбора проекта"""
@@ -624,13 +893,122 @@ class ModernTaskManagerGUI:
     
     def refresh_tasks(self, project_id):
         """Обновление задач проекта"""
-        tasks = self.manager.get_tasks_by_project(project_id)
+        self.tasks_project_id = project_id
+        if self.manager.count_tasks(project_id) <= IN_MEMORY_TASKS_LIMIT:
+            # Небольшой проект загружаем целиком и фильтруем в памяти
+            self.tasks_index = TaskIndex(self.manager.get_tasks_by_project(project_id))
+        else:
+            self.tasks_index = None
+        self.apply_task_filter()
+    
+    def current_task_filter(self):
+        """Фильтр задач по состоянию панели фильтров"""
+        status = self.filter_status.get()
+        priority = self.filter_priority.get()
+        return TaskFilter(
+            statuses=[self.manager.statuses.code(status)] if status != FILTER_ALL else None,
+            priorities=[self.manager.priorities.code(priority)] if priority != FILTER_ALL else None,
+            assignee=self.filter_assignee.winfo_children()[0].get().strip(),
+            text=self.filter_text.winfo_children()[0].get(),
+            order_by=self.tasks_sort,
+            group_by=GROUP_CHOICES.get(self.filter_group.get())
+        )
+    
+    def schedule_task_filter(self, event=None):
+        """Отложенное применение фильтров, чтобы не перезагружать список на каждое нажатие"""
+        if self._filter_job is not None:
+            self.root.after_cancel(self._filter_job)
+        self._filter_job = self.root.after(FILTER_DEBOUNCE_MS, self.apply_task_filter)
+    
+    def apply_task_filter(self):
+        """Применение фильтров и сортировки к списку задач"""
+        self._filter_job = None
+        if self.tasks_project_id is None:
+            return
+        
+        task_filter = self.current_task_filter()
+        self.tasks_filter = task_filter
+        if self.tasks_index is not None:
+            self.tasks_shown = self.tasks_index.query(task_filter)
+            self.tasks_counts = None
+        else:
+            # Показывается первая страница, а счётчики групп считает база по всем задачам
+            self.tasks_shown = self.manager.query_tasks(self.tasks_project_id, task_filter,
+                                                        limit=TASKS_PAGE_SIZE)
+            self.tasks_counts = self.manager.count_task_groups(self.tasks_project_id, task_filter)
+        self.show_tasks(self.tasks_shown, task_filter.group_by, self.tasks_counts)
+    
+    def load_more_tasks(self):
+        """Следующая страница задач большого проекта"""
+        if self.tasks_index is not None or self.tasks_filter is None:
+            return
+        self.tasks_shown += self.manager.query_tasks(self.tasks_project_id, self.tasks_filter,
+                                                     limit=TASKS_PAGE_SIZE, offset=len(self.tasks_shown))
+        self.show_tasks(self.tasks_shown, self.tasks_filter.group_by, self.tasks_counts)
+    
+    def show_tasks(self, tasks, group_by=None, counts=None):
+        """Вывод задач в таблицу, при необходимости по группам
+        
+        counts - полные количества по группам, если загружена только часть задач.
+        """
         self.tasks_tree.delete(*self.tasks_tree.get_children())
-        for task in tasks:
-            self.tasks_tree.insert('', 'end', values=(
-                task['id'], task['title'], task['status'], 
-                task['assignee'], task['priority']
-            ))
+        self.tasks_tree['show'] = 'tree headings' if group_by else 'headings'
+        # Версии показанных задач для изменения без перезаписи чужих правок
+        self.task_versions = {}
+        
+        for key, label, group in group_tasks(tasks, group_by):
+            parent = ''
+            if group_by:
+                count = counts.get(key, len(group)) if counts else len(group)
+                shown = f"{len(group)} из {count}" if count > len(group) else f"{count}"
+                parent = self.tasks_tree.insert('', 'end', text=f"{label or 'Не назначен'} ({shown})",
+                                                open=True, tags=('group',))
+            for task in group:
+                self.task_versions[task['id']] = task['version']
+                self.tasks_tree.insert(parent, 'end', values=(
+                    task['id'], task['title'], task['status'], 
+                    task['assignee'], task['priority'],
+                    task['comment_count'], task['last_activity'] or ''
+                ))
+        
+        total = sum(counts.values()) if counts else len(tasks)
+        if total > len(tasks):
+            self.tasks_page_label.config(text=f"Показано {len(tasks)} из {total}")
+            self.tasks_more_button.pack(side='right')
+        else:
+            self.tasks_page_label.config(text=f"Задач: {total}")
+            self.tasks_more_button.pack_forget()
+    
+    def on_tasks_heading_click(self, column):
+        """Сортировка по клику на заголовок: повторный клик меняет направление"""
+        key = TASK_SORT_COLUMNS[column]
+        if self.tasks_sort and self.tasks_sort[0][0] == key:
+            self.tasks_sort[0] = (key, not self.tasks_sort[0][1])
+        else:
+            # Новый столбец становится главным, предыдущие - дополнительными
+            previous = [item for item in self.tasks_sort if item[0] != key]
+            self.tasks_sort = [(key, False)] + previous[:MAX_SORT_KEYS - 1]
+        self.update_tasks_headings()
+        self.apply_task_filter()
+    
+    def update_tasks_headings(self):
+        """Стрелки направления сортировки в заголовках таблицы задач"""
+        order = {key: (position, desc) for position, (key, desc) in enumerate(self.tasks_sort)}
+        for col, text in self.tasks_headings.items():
+            key = TASK_SORT_COLUMNS[col]
+            if key in order:
+                position, desc = order[key]
+                arrow = '▼' if desc else '▲'
+                text = f"{text} {arrow}" if position == 0 else f"{text} {arrow}{position + 1}"
+            self.tasks_tree.heading(col, text=text)
+    
+    def get_selected_task_id(self):
+        """ID выбранной задачи (None, если выбрана строка группы)"""
+        selected = self.tasks_tree.selection()
+        if not selected:
+            return None
+        values = self.tasks_tree.item(selected[0])['values']
+        return values[0] if values else None
     
     def on_task_selected_for_comments(self, event):
         """Обработчик выбора задачи для комментариев"""
@@ -642,17 +1020,87 @@ class ModernTaskManagerGUI:
     
     def refresh_comments(self, task_id):
         """Обновление комментариев задачи"""
-        comments = self.manager.get_comments(task_id)
         self.comments_tree.delete(*self.comments_tree.get_children())
-        for comment in comments:
-            # Обрезаем длинный текст для отображения
-            text = comment['text']
-            if len(text) > 50:
-                text = text[:50] + '...'
+        self.comment_pages = {}
+        self.comment_versions = {}
+        self.reply_to_id = None
+        self.reply_label.config(text="")
+        self.show_comment_body("")
+        self.load_comment_page(task_id, None, '', 0)
+        self.update_comment_count(task_id)
+    
+    def update_comment_count(self, task_id):
+        """Обновление счётчика комментариев выбранной задачи в списке задач"""
+        selected = self.comments_tasks_tree.selection()
+        task = self.manager.get_task(task_id)
+        if not selected or task is None:
+            return
+        values = list(self.comments_tasks_tree.item(selected[0])['values'])
+        if values and values[0] == task_id:
+            values[3] = task['comment_count']
+            self.comments_tasks_tree.item(selected[0], values=values)
+    
+    def load_comment_page(self, task_id, parent_id, parent_item, offset):
+        """Загрузка страницы комментариев ветки (только превью)"""
+        comments = self.manager.get_comment_previews(task_id, parent_id, COMMENTS_PAGE_SIZE + 1, offset)
+        
+        for comment in comments[:COMMENTS_PAGE_SIZE]:
+            text = comment['preview']
+            if comment['length'] > len(text):
+                text += '...'
             
-            self.comments_tree.insert('', 'end', values=(
+            item = self.comments_tree.insert(parent_item, 'end', iid=f"c{comment['id']}", values=(
                 comment['id'], comment['author'], text, comment['created_date']
             ))
+            self.comment_versions[comment['id']] = comment['version']
+            if comment['replies']:
+                # Заглушка, чтобы ветку можно было раскрыть
+                self.comments_tree.insert(item, 'end', iid=f"stub{comment['id']}",
+                                          text=f"{comment['replies']}…")
+        
+        if len(comments) > COMMENTS_PAGE_SIZE:
+            more_item = self.comments_tree.insert(parent_item, 'end', text="ещё…", tags=('more',))
+            self.comment_pages[more_item] = (task_id, parent_id, parent_item, offset + COMMENTS_PAGE_SIZE)
+    
+    def on_comment_opened(self, event):
+        """Подгрузка ответов при раскрытии ветки"""
+        item = self.comments_tree.focus()
+        stub = f"stub{item[1:]}"
+        if item.startswith('c') and self.comments_tree.exists(stub):
+            self.comments_tree.delete(stub)
+            self.load_comment_page(self.selected_task_id, int(item[1:]), item, 0)
+    
+    def on_comment_selected(self, event):
+        """Показ полного текста или загрузка следующей страницы"""
+        selected = self.comments_tree.selection()
+        if not selected:
+            return
+        item = selected[0]
+        
+        if item in self.comment_pages:
+            task_id, parent_id, parent_item, offset = self.comment_pages.pop(item)
+            self.comments_tree.delete(item)
+            self.load_comment_page(task_id, parent_id, parent_item, offset)
+        elif item.startswith('c'):
+            self.show_comment_body(self.manager.get_comment_text(int(item[1:])) or "")
+    
+    def show_comment_body(self, text):
+        """Вывод полного текста комментария"""
+        self.comment_body.config(state='normal')
+        self.comment_body.delete('1.0', 'end')
+        self.comment_body.insert('1.0', text)
+        self.comment_body.config(state='disabled')
+    
+    def reply_to_comment(self):
+        """Выбор комментария, на который отвечаем"""
+        selected = self.comments_tree.selection()
+        if not selected or not selected[0].startswith('c'):
+            messagebox.showerror("Ошибка", "Выберите комментарий для ответа")
+            return
+        
+        self.reply_to_id = int(selected[0][1:])
+        self.reply_label.config(text=f"Ответ на комментарий #{self.reply_to_id}")
+        self.comment_text.focus_set()
     
     def refresh_all_data(self):
         """Полное обновление данных"""
@@ -687,8 +1135,11 @@ class ModernTaskManagerGUI:
             return
         
         project_id = self.projects_tree.item(selected[0])['values'][0]
-        self.manager.delete_project(project_id)
-        messagebox.showinfo("Успех", "Проект удален!")
+        version = next((p['version'] for p in self.projects_cache if p['id'] == project_id), None)
+        if self.manager.delete_project(project_id, version):
+            messagebox.showinfo("Успех", "Проект удален!")
+        else:
+            messagebox.showwarning("Конфликт", CONFLICT_MESSAGE)
         self.refresh_projects()
         self.refresh_all_tasks()
     
@@ -725,8 +1176,8 @@ class ModernTaskManagerGUI:
     
     def update_task_status(self):
         """Обновление статуса задачи"""
-        selected = self.tasks_tree.selection()
-        if not selected:
+        task_id = self.get_selected_task_id()
+        if task_id is None:
             messagebox.showerror("Ошибка", "Выберите задачу")
             return
         
@@ -735,9 +1186,10 @@ class ModernTaskManagerGUI:
             messagebox.showerror("Ошибка", "Выберите новый статус")
             return
         
-        task_id = self.tasks_tree.item(selected[0])['values'][0]
-        self.manager.update_task_status(task_id, new_status)
-        messagebox.showinfo("Успех", "Статус задачи обновлен!")
+        if self.manager.update_task_status(task_id, new_status, self.task_versions.get(task_id)):
+            messagebox.showinfo("Успех", "Статус задачи обновлен!")
+        else:
+            messagebox.showwarning("Конфликт", CONFLICT_MESSAGE)
         
         selected_project = self.project_combo.get()
         if selected_project and selected_project != "Выберите проект":
@@ -746,14 +1198,15 @@ class ModernTaskManagerGUI:
     
     def delete_task(self):
         """Удаление задачи"""
-        selected = self.tasks_tree.selection()
-        if not selected:
+        task_id = self.get_selected_task_id()
+        if task_id is None:
             messagebox.showerror("Ошибка", "Выберите задачу для удаления")
             return
         
-        task_id = self.tasks_tree.item(selected[0])['values'][0]
-        self.manager.delete_task(task_id)
-        messagebox.showinfo("Успех", "Задача удалена!")
+        if self.manager.delete_task(task_id, self.task_versions.get(task_id)):
+            messagebox.showinfo("Успех", "Задача удалена!")
+        else:
+            messagebox.showwarning("Конфликт", CONFLICT_MESSAGE)
         
         selected_project = self.project_combo.get()
         if selected_project and selected_project != "Выберите проект":
@@ -774,8 +1227,10 @@ class ModernTaskManagerGUI:
             messagebox.showerror("Ошибка", "Заполните автора и текст комментария")
             return
         
-        success = self.manager.add_comment(self.selected_task_id, author, text)
+        success = self.manager.add_comment(self.selected_task_id, author, text, self.reply_to_id)
         if success:
+            self.reply_to_id = None
+            self.reply_label.config(text="")
             messagebox.showinfo("Успех", "Комментарий добавлен!")
             self.comment_author_entry.winfo_children()[0].delete(0, 'end')
             self.comment_text.delete('1.0', 'end')
@@ -790,22 +1245,92 @@ class ModernTaskManagerGUI:
             messagebox.showerror("Ошибка", "Выберите комментарий для удаления")
             return
         
-        comment_id = self.comments_tree.item(selected[0])['values'][0]
-        self.manager.delete_comment(comment_id)
-        messagebox.showinfo("Успех", "Комментарий удален!")
+        if not selected[0].startswith('c'):
+            messagebox.showerror("Ошибка", "Выберите комментарий для удаления")
+            return
+        
+        comment_id = int(selected[0][1:])
+        if self.manager.delete_comment(comment_id, self.comment_versions.get(comment_id)):
+            messagebox.showinfo("Успех", "Комментарий удален!")
+        else:
+            messagebox.showwarning("Конфликт", CONFLICT_MESSAGE)
         
         if hasattr(self, 'selected_task_id'):
             self.refresh_comments(self.selected_task_id)
     
+    def create_backup(self):
+        """Резервная копия базы в фоне, без остановки интерфейса"""
+        db = getattr(self.manager, 'db', None)
+        if db is None:
+            messagebox.showerror("Ошибка", "Резервное копирование доступно только для одной базы данных")
+            return
+        
+        backup_dir = os.path.join(os.path.dirname(os.path.abspath(db.db_name)), 'backups')
+        backups = BackupManager(db.db_name, backup_dir)
+        self.run_in_background(backups.create_snapshot, self.on_backup_done)
+    
+    def on_backup_done(self, snapshot, error):
+        """Результат резервного копирования"""
+        if error is not None:
+            messagebox.showerror("Ошибка", f"Не удалось создать копию: {error}")
+        elif snapshot is None:
+            messagebox.showerror("Ошибка", "Копия не прошла проверку целостности")
+        else:
+            messagebox.showinfo("Успех", f"Резервная копия создана:\n{snapshot['path']}")
+    
+    def run_in_background(self, func, callback):
+        """Выполнение func в отдельном потоке, callback(result, error) - в потоке интерфейса"""
+        results = queue.Queue()
+        
+        def worker():
+            try:
+                results.put((func(), None))
+            except Exception as e:
+                results.put((None, e))
+        
+        def poll():
+            try:
+                result, error = results.get_nowait()
+            except queue.Empty:
+                self.root.after(100, poll)
+                return
+            callback(result, error)
+        
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+    
     def show_create_project(self):
         """Показ диалога создания проекта"""
+        self.build_tab(self.projects_frame)
         self.create_project()
 
 def main():
     """Запуск приложения"""
+    timer = StartupTimer()
     root = tk.Tk()
-    app = ModernTaskManagerGUI(root)
+    timer.mark('tk')
+    # TASKFLOW_EAGER=1 возвращает прежнюю синхронную загрузку
+    lazy = os.environ.get('TASKFLOW_EAGER') != '1'
+    manager = None
+    registry = None
+    if os.environ.get('TASKFLOW_WORKSPACE'):
+        # База рабочего пространства отдела (см. workspaces.py)
+        from workspaces import WorkspaceRegistry
+        registry = WorkspaceRegistry(os.environ.get('TASKFLOW_WORKSPACES', 'workspaces'))
+        manager = registry.get(os.environ['TASKFLOW_WORKSPACE'], create=True)
+    elif os.environ.get('TASKFLOW_SHARDS'):
+        # Шардированный режим: TASKFLOW_SHARDS - число файлов-шардов
+        from sharding import ShardedTaskManager
+        manager = ShardedTaskManager(
+            os.environ.get('TASKFLOW_SHARD_BASE', 'tasks'), int(os.environ['TASKFLOW_SHARDS'])
+        )
+    app = ModernTaskManagerGUI(root, manager=manager, lazy=lazy, timer=timer)
+    if not lazy:
+        root.after_idle(lambda: (timer.mark('first_paint'), timer.emit()))
     root.mainloop()
+    if registry is not None:
+        # Остановка фоновых потоков реестра и закрытие базы пространства
+        registry.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
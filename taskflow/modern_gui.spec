@@ -34,7 +34,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # распаковка UPX заметно замедляет холодный старт
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,  # False для GUI приложения
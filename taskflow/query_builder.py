@@ -0,0 +1,134 @@
+"""Построитель SELECT-запросов
+
+Имена таблиц и столбцов проверяются по шаблону идентификатора, операторы -
+по белому списку, а все значения передаются только параметрами. Одинаковые
+по форме запросы дают одинаковый текст SQL и поэтому попадают в кэш
+подготовленных выражений соединения.
+"""
+
+import re
+
+IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+
+OPERATORS = ('=', '!=', '<', '<=', '>', '>=', 'LIKE', 'IS', 'IS NOT')
+
+
+def unicode_lower(value):
+    """Функция SQL unicode_lower: встроенные LIKE и lower() понимают регистр только ASCII"""
+    return value.lower() if isinstance(value, str) else value
+
+
+def identifier(name):
+    """Проверка имени таблицы или столбца"""
+    if not IDENTIFIER.match(name):
+        raise ValueError(f"Недопустимый идентификатор: {name!r}")
+    return name
+
+
+def _column(name):
+    # Разрешены '*' и 'таблица.*'
+    if name == '*' or (name.endswith('.*') and identifier(name[:-2])):
+        return name
+    return identifier(name)
+
+
+class Query:
+    """SELECT-запрос, собираемый по частям"""
+
+    def __init__(self, table, columns=('*',), alias=None):
+        self.table = identifier(table) + (f" {identifier(alias)}" if alias else "")
+        self.columns = [_column(column) for column in columns]
+        self.joins = []
+        self.conditions = []
+        self.params = []
+        self.ordering = []
+        self.limit_value = None
+        self.offset_value = 0
+
+    def join(self, table, left, right, alias=None, kind='LEFT'):
+        """JOIN по равенству двух столбцов"""
+        if kind not in ('LEFT', 'INNER'):
+            raise ValueError(f"Недопустимый тип JOIN: {kind}")
+        target = identifier(table) + (f" {identifier(alias)}" if alias else "")
+        self.joins.append(f"{kind} JOIN {target} ON {identifier(left)} = {identifier(right)}")
+        return self
+
+    def where(self, column, op, value):
+        """Условие column <op> ?"""
+        if op not in OPERATORS:
+            raise ValueError(f"Недопустимый оператор: {op}")
+        self.conditions.append(f"{identifier(column)} {op} ?")
+        self.params.append(value)
+        return self
+
+    def where_in(self, column, values):
+        """Условие column IN (?, ?, ...)"""
+        values = list(values)
+        if not values:
+            self.conditions.append("0")
+            return self
+        self.conditions.append(f"{identifier(column)} IN ({', '.join('?' * len(values))})")
+        self.params.extend(values)
+        return self
+
+    def where_like(self, column, text):
+        """Поиск подстроки с экранированием % и _"""
+        escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        self.conditions.append(f"{identifier(column)} LIKE ? ESCAPE '\\'")
+        self.params.append(f"%{escaped}%")
+        return self
+
+    def where_contains(self, column, text):
+        """Поиск подстроки без учёта регистра (в том числе для кириллицы)
+
+        Соединение должно иметь функцию unicode_lower (её регистрирует Database).
+        """
+        self.conditions.append(f"instr(unicode_lower({identifier(column)}), ?) > 0")
+        self.params.append(text.lower())
+        return self
+
+    def order_by(self, column, desc=False, lower=False, null_as_empty=False):
+        """Добавление столбца сортировки
+
+        lower - сравнение через unicode_lower (без учёта регистра),
+        null_as_empty - NULL сортируется вместе с пустой строкой.
+        """
+        expression = identifier(column)
+        if lower:
+            expression = f"unicode_lower({expression})"
+        if null_as_empty:
+            expression = f"COALESCE({expression}, '')"
+        self.ordering.append(f"{expression} {'DESC' if desc else 'ASC'}")
+        return self
+
+    def limit(self, limit, offset=0):
+        """Ограничение количества строк"""
+        self.limit_value = int(limit)
+        self.offset_value = int(offset)
+        return self
+
+    def build(self):
+        """Текст SQL и параметры"""
+        sql = f"SELECT {', '.join(self.columns)} {self._from_where()}"
+        if self.ordering:
+            sql += " ORDER BY " + ", ".join(self.ordering)
+        params = list(self.params)
+        if self.limit_value is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([self.limit_value, self.offset_value])
+        return sql, params
+
+    def build_count(self, group_by=None):
+        """COUNT(*) по тем же условиям, с group_by - пары (значение, количество)"""
+        if group_by is None:
+            return f"SELECT COUNT(*) {self._from_where()}", list(self.params)
+        column = identifier(group_by)
+        return f"SELECT {column}, COUNT(*) {self._from_where()} GROUP BY {column}", list(self.params)
+
+    def _from_where(self):
+        sql = f"FROM {self.table}"
+        if self.joins:
+            sql += " " + " ".join(self.joins)
+        if self.conditions:
+            sql += " WHERE " + " AND ".join(self.conditions)
+        return sql
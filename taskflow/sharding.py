@@ -0,0 +1,609 @@
+"""Шардирование: проекты распределяются по нескольким файлам SQLite
+
+Каталог (<base>_catalog.db) хранит имена проектов и номер шарда, в котором
+лежит проект. Задачи и комментарии каждого шарда получают ID из отдельного
+диапазона, поэтому шард задачи или комментария определяется по самому ID.
+"""
+
+import argparse
+import heapq
+import os
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from operator import itemgetter
+
+import change_log
+from task_manager import TaskManager, TASK_STREAM_COLUMNS
+
+# Размер диапазона ID задач и комментариев, выделенного одному шарду
+ID_RANGE = 10 ** 12
+
+# Размер страницы при обходе шардов по ключу (created_date, id)
+MERGE_PAGE_SIZE = 500
+
+
+class ShardCatalog:
+    """Каталог проектов: глобальные ID, уникальные имена и номер шарда"""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._local = threading.local()
+        conn = sqlite3.connect(self.db_name)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS project_shards (
+                project_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL UNIQUE,
+                shard INTEGER NOT NULL
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """Изменения каталога одной транзакцией (вложенные вызовы объединяются)
+
+        Пакетный режим cli.py открывает её вместе с транзакциями шардов,
+        чтобы при откате не оставалось записей о несозданных проектах.
+        """
+        if getattr(self._local, 'conn', None) is not None:
+            yield self._local.conn
+            return
+        conn = sqlite3.connect(self.db_name)
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.conn = conn
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._local.conn = None
+            conn.close()
+
+    @contextmanager
+    def _connect(self):
+        """Соединение открытой транзакции текущего потока или новое на один вызов"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = sqlite3.connect(self.db_name)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def add(self, name, shard_count):
+        """Регистрация проекта, возвращает (project_id, shard) или None"""
+        with self._connect() as conn:
+            try:
+                cursor = conn.execute(
+                    "INSERT INTO project_shards (name, shard) VALUES (?, -1)", (name,)
+                )
+            except sqlite3.IntegrityError:
+                return None
+            project_id = cursor.lastrowid
+            shard = project_id % shard_count
+            conn.execute("UPDATE project_shards SET shard = ? WHERE project_id = ?", (shard, project_id))
+            return project_id, shard
+
+    def remove(self, project_id):
+        """Удаление проекта из каталога"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM project_shards WHERE project_id = ?", (project_id,))
+
+    def shard_of(self, project_id):
+        """Номер шарда проекта или None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT shard FROM project_shards WHERE project_id = ?", (project_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def find(self, reference):
+        """ID проекта по ID или названию или None"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT project_id FROM project_shards WHERE project_id = ? OR name = ? "
+                "ORDER BY project_id = ? DESC LIMIT 1", (str(reference),) * 3
+            ).fetchone()
+        return row[0] if row else None
+
+    def counts(self):
+        """Количество проектов в каждом шарде"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT shard, COUNT(*) FROM project_shards GROUP BY shard").fetchall()
+        return dict(rows)
+
+
+class ShardedTaskManager:
+    """Менеджер задач поверх нескольких шардов с тем же интерфейсом, что TaskManager"""
+
+    def __init__(self, base_name='tasks', shard_count=4):
+        self.base_name = base_name
+        self.catalog = ShardCatalog(f"{base_name}_catalog.db")
+        self.shards = [TaskManager(self.shard_path(i)) for i in range(shard_count)]
+        for index, shard in enumerate(self.shards):
+            self._reserve_id_range(shard, index)
+        self.statuses = self.shards[0].statuses
+        self.priorities = self.shards[0].priorities
+        self.pool = ThreadPoolExecutor(max_workers=shard_count, thread_name_prefix='shard')
+
+    def shard_path(self, index):
+        """Путь к файлу шарда"""
+        return f"{self.base_name}_shard{index}.db"
+
+    def _reserve_id_range(self, shard, index):
+        """Начальные значения AUTOINCREMENT для задач и комментариев шарда"""
+        start = index * ID_RANGE
+        if start == 0:
+            return
+        conn = sqlite3.connect(shard.db.db_name)
+        for table in ('tasks', 'comments'):
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+            if row is None:
+                conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, start))
+            elif row[0] < start:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = ?", (start, table))
+        conn.commit()
+        conn.close()
+
+    # Маршрутизация
+    def shard_for_project(self, project_id):
+        """Шард, в котором лежит проект"""
+        index = self.catalog.shard_of(project_id)
+        return self.shards[index] if index is not None else None
+
+    def shard_for_id(self, row_id):
+        """Шард задачи или комментария по диапазону ID"""
+        index = int(row_id) // ID_RANGE
+        return self.shards[index] if 0 <= index < len(self.shards) else None
+
+    @property
+    def in_transaction(self):
+        """Открыта ли в текущем потоке транзакция хотя бы одного шарда"""
+        return any(shard.db.in_transaction for shard in self.shards)
+
+    def submit(self, fn, *args):
+        """Вызов в пуле потоков, а внутри транзакции - сразу в текущем потоке
+
+        У потоков пула свои соединения, и незафиксированных изменений
+        транзакции текущего потока они не видят.
+        """
+        if not self.in_transaction:
+            return self.pool.submit(fn, *args)
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def fan_out(self, method, *args):
+        """Параллельный вызов метода на всех шардах"""
+        futures = [self.submit(getattr(shard, method), *args) for shard in self.shards]
+        return [future.result() for future in futures]
+
+    # Справочники
+    def get_statuses(self, locale='ru'):
+        """Названия статусов в порядке сортировки"""
+        return self.shards[0].get_statuses(locale)
+
+    def get_priorities(self, locale='ru'):
+        """Названия приоритетов в порядке сортировки"""
+        return self.shards[0].get_priorities(locale)
+
+    # Проекты
+    def create_project(self, name, description=""):
+        """Создание проекта в шарде, выбранном по его ID"""
+        registered = self.catalog.add(name, len(self.shards))
+        if registered is None:
+            return False
+        project_id, index = registered
+        success = self.shards[index].db.execute_query(
+            "INSERT INTO projects (id, name, description) VALUES (?, ?, ?)",
+            (project_id, name, description)
+        )
+        if not success:
+            self.catalog.remove(project_id)
+        return success
+
+    def get_all_projects(self):
+        """Проекты всех шардов, упорядоченные по дате создания"""
+        per_shard = self.fan_out('get_all_projects')
+        projects = [project for projects in per_shard for project in projects]
+        projects.sort(key=lambda p: (p['created_date'] or '', p['id']), reverse=True)
+        return projects
+
+    def find_project(self, reference):
+        """Проект по ID или названию: каталог, затем один шард"""
+        project_id = self.catalog.find(reference)
+        shard = self.shard_for_project(project_id) if project_id is not None else None
+        return shard.find_project(project_id) if shard else None
+
+    def delete_project(self, project_id, expected_version=None):
+        """Удаление проекта"""
+        shard = self.shard_for_project(project_id)
+        if shard is not None and not shard.delete_project(project_id, expected_version):
+            return False
+        self.catalog.remove(project_id)
+        return shard is not None
+
+    # Задачи
+    def create_task(self, title, project_id, *args, **kwargs):
+        """Создание задачи в шарде проекта"""
+        shard = self.shard_for_project(project_id)
+        return shard.create_task(title, project_id, *args, **kwargs) if shard else False
+
+    def get_tasks_by_project(self, project_id, include_archived=False):
+        """Получение задач по проекту"""
+        shard = self.shard_for_project(project_id)
+        return shard.get_tasks_by_project(project_id, include_archived) if shard else []
+
+    def count_tasks(self, project_id):
+        """Количество задач в проекте"""
+        shard = self.shard_for_project(project_id)
+        return shard.count_tasks(project_id) if shard else 0
+
+    def query_tasks(self, project_id, task_filter, limit=None, offset=0):
+        """Задачи проекта с фильтрами и сортировкой"""
+        shard = self.shard_for_project(project_id)
+        return shard.query_tasks(project_id, task_filter, limit, offset) if shard else []
+
+    def count_task_groups(self, project_id, task_filter):
+        """Количество задач по фильтру: {ключ группы: количество}"""
+        shard = self.shard_for_project(project_id)
+        return shard.count_task_groups(project_id, task_filter) if shard else {}
+
+    def get_task(self, task_id):
+        """Задача по ID"""
+        shard = self.shard_for_id(task_id)
+        return shard.get_task(task_id) if shard else None
+
+    def task_exists(self, title, project_id):
+        """Проверка существования задачи"""
+        shard = self.shard_for_project(project_id)
+        return shard.task_exists(title, project_id) if shard else False
+
+    def find_task_id(self, title, project_id):
+        """ID задачи по названию в проекте"""
+        shard = self.shard_for_project(project_id)
+        return shard.find_task_id(title, project_id) if shard else None
+
+    def update_task_status(self, task_id, new_status, expected_version=None):
+        """Обновление статуса задачи"""
+        shard = self.shard_for_id(task_id)
+        return shard.update_task_status(task_id, new_status, expected_version) if shard else False
+
+    def delete_task(self, task_id, expected_version=None):
+        """Удаление задачи"""
+        shard = self.shard_for_id(task_id)
+        return shard.delete_task(task_id, expected_version) if shard else False
+
+    def stale_rows(self, table, versions):
+        """ID строк, изменённых или удалённых с момента чтения (по шардам)"""
+        pairs = list(versions.items()) if isinstance(versions, dict) else list(versions)
+        by_shard = {}
+        stale = set()
+        for row_id, version in pairs:
+            if table == 'projects':
+                shard = self.shard_for_project(row_id)
+            else:
+                shard = self.shard_for_id(row_id)
+            if shard is None:
+                stale.add(row_id)
+            else:
+                by_shard.setdefault(id(shard), (shard, []))[1].append((row_id, version))
+        futures = [self.submit(shard.stale_rows, table, shard_pairs)
+                   for shard, shard_pairs in by_shard.values()]
+        for future in futures:
+            stale.update(future.result())
+        return stale
+
+    def get_all_tasks(self, include_archived=False):
+        """Задачи всех шардов (как TaskManager.get_all_tasks)"""
+        if include_archived:
+            per_shard = self.fan_out('get_all_tasks', True)
+            return sorted((row for rows in per_shard for row in rows), key=_task_key, reverse=True)
+        return self.shards[0].label_task_rows(self.iter_all_tasks())
+
+    def get_most_active_tasks(self, limit=20, project_id=None):
+        """Задачи с самой свежей активностью во всех шардах"""
+        if project_id is not None:
+            shard = self.shard_for_project(project_id)
+            return shard.get_most_active_tasks(limit, project_id) if shard else []
+        per_shard = self.fan_out('get_most_active_tasks', limit)
+        tasks = [task for tasks in per_shard for task in tasks]
+        tasks.sort(key=lambda task: task['last_activity'] or '', reverse=True)
+        return tasks[:limit]
+
+    def search_tasks(self, text, project_id=None, include_archived=False):
+        """Поиск задач по подстроке во всех шардах или в шарде проекта"""
+        if project_id is not None:
+            shard = self.shard_for_project(project_id)
+            return shard.search_tasks(text, project_id, include_archived) if shard else []
+        per_shard = self.fan_out('search_tasks', text, None, include_archived)
+        tasks = [task for tasks in per_shard for task in tasks]
+        tasks.sort(key=lambda task: (task['created_date'] or '', task['id']), reverse=True)
+        return tasks
+
+    # Архив
+    def archive_completed(self, days=30, project_id=None):
+        """Перенос в архив давно выполненных задач во всех шардах"""
+        if project_id is not None:
+            shard = self.shard_for_project(project_id)
+            return shard.archive_completed(days, project_id) if shard else 0
+        return sum(self.fan_out('archive_completed', days))
+
+    def restore_archived_task(self, task_id):
+        """Возврат задачи из архива её шарда"""
+        shard = self.shard_for_id(task_id)
+        return shard.restore_archived_task(task_id) if shard else False
+
+    def iter_all_tasks(self, columns=TASK_STREAM_COLUMNS, chunk_size=MERGE_PAGE_SIZE):
+        """Слияние задач всех шардов по (created_date, id) с подгрузкой порций"""
+        streams = [self._iter_shard_tasks(shard, columns, chunk_size) for shard in self.shards]
+        return (row for _key, row in heapq.merge(*streams, key=itemgetter(0), reverse=True))
+
+    def get_all_tasks_page(self, limit=MERGE_PAGE_SIZE, cursor=None, columns=TASK_STREAM_COLUMNS):
+        """Страница задач всех шардов и курсор следующей страницы
+
+        Курсор - пара (created_date, id) последней строки страницы.
+        """
+        futures = [self.submit(shard.fetch_tasks_page, columns, limit, cursor, True)
+                   for shard in self.shards]
+        pages = [future.result()[0] for future in futures]
+        merged = list(heapq.merge(*pages, key=itemgetter(0), reverse=True))[:limit]
+        next_cursor = merged[-1][0] if len(merged) == limit else None
+        return [row for _key, row in merged], next_cursor
+
+    def _iter_shard_tasks(self, shard, columns, chunk_size):
+        # Следующая порция читается в фоне, пока потребитель обходит текущую
+        chunks = shard.iter_task_chunks(columns, chunk_size, keyed=True)
+        future = self.submit(next, chunks, None)
+        while True:
+            chunk = future.result()
+            if chunk is None:
+                return
+            future = self.submit(next, chunks, None)
+            yield from chunk
+
+    # Комментарии
+    def add_comment(self, task_id, author, text, parent_id=None):
+        """Добавление комментария в шард задачи"""
+        shard = self.shard_for_id(task_id)
+        return shard.add_comment(task_id, author, text, parent_id) if shard else False
+
+    def get_comments(self, task_id, include_archived=False):
+        """Получение комментариев задачи"""
+        shard = self.shard_for_id(task_id)
+        return shard.get_comments(task_id, include_archived) if shard else []
+
+    def get_comment_previews(self, task_id, *args, **kwargs):
+        """Страница комментариев ветки без полного текста"""
+        shard = self.shard_for_id(task_id)
+        return shard.get_comment_previews(task_id, *args, **kwargs) if shard else []
+
+    def get_comment_text(self, comment_id):
+        """Полный текст комментария"""
+        shard = self.shard_for_id(comment_id)
+        return shard.get_comment_text(comment_id) if shard else None
+
+    def delete_comment(self, comment_id, expected_version=None):
+        """Удаление комментария"""
+        shard = self.shard_for_id(comment_id)
+        return shard.delete_comment(comment_id, expected_version) if shard else False
+
+    # Перебалансировка
+    def move_project(self, project_id, target):
+        """Перенос проекта в другой шард одной транзакцией
+
+        Задачи и комментарии получают новые ID из диапазона целевого шарда.
+        Архивные задачи проекта копируются из архива в архив, минуя рабочие
+        таблицы (в рабочих таблицах может быть задача с тем же названием).
+        Возвращает словарь {старый ID задачи: новый ID} или None.
+        """
+        source = self.catalog.shard_of(project_id)
+        if source is None or not 0 <= target < len(self.shards):
+            return None
+        if source == target:
+            return {}
+        return self._move_project(project_id, source, target)
+
+    def _move_project(self, project_id, source, target):
+        source_archive = self.shards[source].archive
+        target_archive = self.shards[target].archive
+        with_archive = source_archive.exists()
+        if with_archive:
+            # Схемы архивов должны совпадать со схемами шардов
+            source_archive.connect()
+            target_archive.connect()
+
+        conn = sqlite3.connect(self.shard_path(source), isolation_level=None)
+        try:
+            conn.execute("ATTACH DATABASE ? AS dst", (self.shard_path(target),))
+            conn.execute("ATTACH DATABASE ? AS cat", (self.catalog.db_name,))
+            if with_archive:
+                conn.execute("ATTACH DATABASE ? AS archive", (source_archive.path,))
+                conn.execute("ATTACH DATABASE ? AS dst_archive", (target_archive.path,))
+            conn.execute("BEGIN IMMEDIATE")
+
+            project_columns = _columns(conn, 'projects')
+            conn.execute(
+                f"INSERT INTO dst.projects ({project_columns}) "
+                f"SELECT {project_columns} FROM main.projects WHERE id = ?",
+                (project_id,)
+            )
+
+            task_map = _copy_rows(
+                conn, 'tasks', "project_id = ?", (project_id,), remap={}
+            )
+            comment_map = {}
+            _copy_rows(
+                conn, 'comments',
+                "task_id IN (SELECT id FROM main.tasks WHERE project_id = ?)", (project_id,),
+                remap={'task_id': task_map, 'parent_id': comment_map}, id_map=comment_map
+            )
+
+            # Триггеры целевого шарда посчитали скопированные комментарии новой
+            # активностью; возвращаем счётчики и время активности из исходного шарда
+            conn.executemany(
+                "UPDATE dst.tasks SET comment_count = ?, last_activity = ? WHERE id = ?",
+                [(comment_count, last_activity, task_map[task_id])
+                 for task_id, comment_count, last_activity in conn.execute(
+                     "SELECT id, comment_count, last_activity FROM main.tasks WHERE project_id = ?",
+                     (project_id,)
+                 )]
+            )
+
+            if with_archive:
+                _copy_archived(conn, project_id, task_map, comment_map)
+
+            conn.execute(
+                "DELETE FROM main.comments WHERE task_id IN "
+                "(SELECT id FROM main.tasks WHERE project_id = ?)", (project_id,)
+            )
+            conn.execute("DELETE FROM main.tasks WHERE project_id = ?", (project_id,))
+            conn.execute("DELETE FROM main.projects WHERE id = ?", (project_id,))
+            conn.execute(
+                "UPDATE cat.project_shards SET shard = ? WHERE project_id = ?", (target, project_id)
+            )
+            conn.execute("COMMIT")
+            return task_map
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def shard_stats(self):
+        """Количество проектов и задач в каждом шарде"""
+        projects = self.catalog.counts()
+        stats = []
+        for index, shard in enumerate(self.shards):
+            tasks = shard.db.fetch_one("SELECT COUNT(*) FROM tasks")[0]
+            stats.append({'shard': index, 'projects': projects.get(index, 0), 'tasks': tasks})
+        return stats
+
+    def close(self):
+        """Остановка пула потоков и закрытие соединений шардов"""
+        self.pool.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+
+
+def _task_key(row):
+    # Строка get_all_tasks: столбцы TASK_COLUMNS, created_date - девятый
+    return (row[8] or '', row[0])
+
+
+def _columns(conn, table):
+    """Список столбцов таблицы шарда через запятую"""
+    return ", ".join(row[1] for row in conn.execute(f"PRAGMA main.table_info({table})"))
+
+
+def _copy_rows(conn, table, where, params, remap, id_map=None):
+    """Копирование строк в dst с новыми ID; возвращает {старый ID: новый ID}"""
+    names = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})") if row[1] != 'id']
+    id_map = {} if id_map is None else id_map
+    insert = (f"INSERT INTO dst.{table} ({', '.join(names)}) "
+              f"VALUES ({', '.join('?' * len(names))})")
+    rows = conn.execute(
+        f"SELECT id, {', '.join(names)} FROM main.{table} WHERE {where} ORDER BY id", params
+    ).fetchall()
+    for row in rows:
+        values = list(row[1:])
+        for position, name in enumerate(names):
+            if name in remap and values[position] is not None:
+                values[position] = remap[name].get(values[position], values[position])
+        id_map[row[0]] = conn.execute(insert, values).lastrowid
+    return id_map
+
+
+def _copy_archived(conn, project_id, task_map, comment_map):
+    """Перенос архивных задач проекта и их комментариев из archive в dst_archive
+
+    Новые ID выдаются из sqlite_sequence целевого шарда, как если бы задачи
+    были созданы в нём, и добавляются в task_map и comment_map.
+    """
+    archived_tasks = "SELECT id FROM {schema}.tasks WHERE project_id = ?"
+    for table, where, remap, id_map in (
+        ('tasks', "project_id = ?", {}, task_map),
+        ('comments', f"task_id IN ({archived_tasks.format(schema='archive')})",
+         {'task_id': task_map, 'parent_id': comment_map}, comment_map),
+    ):
+        names = [row[1] for row in conn.execute(f"PRAGMA archive.table_info({table})") if row[1] != 'id']
+        # Строки в sqlite_sequence нет только у шарда 0 без единой записи
+        row = conn.execute("SELECT seq FROM dst.sqlite_sequence WHERE name = ?", (table,)).fetchone()
+        next_id = row[0] if row else 0
+        rows = conn.execute(
+            f"SELECT id, {', '.join(names)} FROM archive.{table} WHERE {where} ORDER BY id", (project_id,)
+        ).fetchall()
+        values = []
+        for row in rows:
+            next_id += 1
+            id_map[row[0]] = next_id
+            fields = list(row[1:])
+            for position, name in enumerate(names):
+                if name in remap and fields[position] is not None:
+                    fields[position] = remap[name].get(fields[position], fields[position])
+            values.append([next_id] + fields)
+        conn.executemany(
+            f"INSERT INTO dst_archive.{table} (id, {', '.join(names)}) "
+            f"VALUES ({', '.join('?' * (len(names) + 1))})", values
+        )
+        if row is None:
+            conn.execute("INSERT INTO dst.sqlite_sequence (name, seq) VALUES (?, ?)", (table, next_id))
+        else:
+            conn.execute("UPDATE dst.sqlite_sequence SET seq = ? WHERE name = ?", (next_id, table))
+
+    for schema, log_schema in (('archive', 'main'), ('dst_archive', 'dst')):
+        op = 'D' if schema == 'archive' else 'I'
+        change_log.log_archive(conn, 'tasks', op, "project_id = ?", (project_id,), schema, log_schema)
+        change_log.log_archive(conn, 'comments', op, f"task_id IN ({archived_tasks.format(schema=schema)})",
+                               (project_id,), schema, log_schema)
+    conn.execute(f"DELETE FROM archive.comments WHERE task_id IN ({archived_tasks.format(schema='archive')})",
+                 (project_id,))
+    conn.execute("DELETE FROM archive.tasks WHERE project_id = ?", (project_id,))
+
+
+def main():
+    """Инструмент перебалансировки шардов"""
+    parser = argparse.ArgumentParser(description="Шарды TaskFlow")
+    parser.add_argument('--base', default=os.environ.get('TASKFLOW_SHARD_BASE', 'tasks'))
+    parser.add_argument('--shards', type=int, default=int(os.environ.get('TASKFLOW_SHARDS', 4)))
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help="распределение проектов и задач по шардам")
+    move = commands.add_parser('move', help="перенос проекта в другой шард")
+    move.add_argument('project_id', type=int)
+    move.add_argument('target', type=int)
+    args = parser.parse_args()
+
+    manager = ShardedTaskManager(args.base, args.shards)
+    try:
+        if args.command == 'stats':
+            for row in manager.shard_stats():
+                print(f"шард {row['shard']}: проектов {row['projects']}, задач {row['tasks']}")
+        elif args.command == 'move':
+            try:
+                task_map = manager.move_project(args.project_id, args.target)
+            except sqlite3.Error as e:
+                print(f"Database error: {e}")
+                return 1
+            if task_map is None:
+                print("Проект или шард не найден")
+                return 1
+            print(f"Проект {args.project_id} перенесён в шард {args.target}, задач: {len(task_map)}")
+    finally:
+        manager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
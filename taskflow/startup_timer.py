@@ -0,0 +1,50 @@
+"""Замер времени запуска приложения"""
+
+import os
+import sys
+import time
+
+
+class StartupTimer:
+    """Отметки времени от старта процесса до первой отрисовки и загрузки данных"""
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.marks = []
+
+    def mark(self, name):
+        """Добавление отметки времени"""
+        self.marks.append((name, time.perf_counter() - self.start))
+
+    def elapsed(self, name):
+        """Время (в секундах) до отметки или None"""
+        for mark_name, seconds in self.marks:
+            if mark_name == name:
+                return seconds
+        return None
+
+    def report(self):
+        """Текстовый отчёт по отметкам"""
+        lines = ["TaskFlow: время запуска"]
+        previous = 0.0
+        for name, seconds in self.marks:
+            lines.append(f"  {name:<24} {seconds * 1000:8.1f} мс  (+{(seconds - previous) * 1000:.1f} мс)")
+            previous = seconds
+        return "\n".join(lines)
+
+    def emit(self):
+        """Вывод отчёта, если задана переменная окружения TASKFLOW_STARTUP_REPORT
+
+        Значение "1" выводит отчёт в stderr, любое другое значение
+        считается путём к файлу, в который дописывается отчёт.
+        """
+        target = os.environ.get('TASKFLOW_STARTUP_REPORT')
+        if not target:
+            return
+        if target == '1':
+            # В оконной сборке PyInstaller stderr отсутствует
+            if sys.stderr is not None:
+                print(self.report(), file=sys.stderr)
+        else:
+            with open(target, 'a', encoding='utf-8') as report_file:
+                report_file.write(self.report() + "\n")
@@ -0,0 +1,165 @@
+"""Фильтрация, сортировка и группировка списка задач
+
+Один и тот же TaskFilter превращается либо в параметризованный SQL-запрос
+(для больших проектов, с опорой на индексы), либо применяется к уже
+загруженным задачам через TaskIndex.
+"""
+
+from query_builder import Query
+from task_manager import TASK_COLUMNS
+
+# Столбцы, по которым разрешена сортировка: ключ -> столбец таблицы tasks
+SORT_COLUMNS = {
+    'id': 'id',
+    'title': 'title',
+    'status': 'status',
+    'assignee': 'assignee',
+    'priority': 'priority',
+    'created_date': 'created_date',
+    'comment_count': 'comment_count',
+    'last_activity': 'last_activity',
+}
+
+# Ключи словаря задачи, которыми сортируются задачи в памяти
+SORT_KEYS = {
+    'id': 'id',
+    'title': 'title',
+    'status': 'status_code',
+    'assignee': 'assignee',
+    'priority': 'priority_code',
+    'created_date': 'created_date',
+    'comment_count': 'comment_count',
+    'last_activity': 'last_activity',
+}
+
+# Текстовые столбцы: в памяти (_sort_value) они сравниваются без учёта регистра
+CASELESS_SORT = ('title', 'assignee')
+
+GROUP_BY = ('status', 'assignee')
+
+DEFAULT_ORDER = [('created_date', True)]
+
+
+class TaskFilter:
+    """Набор условий отбора и порядок сортировки задач"""
+
+    def __init__(self, statuses=None, priorities=None, assignee=None, text=None,
+                 order_by=None, group_by=None):
+        self.statuses = list(statuses or [])      # коды статусов
+        self.priorities = list(priorities or [])  # коды приоритетов
+        self.assignee = assignee or None          # точное совпадение
+        self.text = (text or '').strip() or None  # подстрока в названии
+        self.order_by = list(order_by or DEFAULT_ORDER)
+        self.group_by = group_by if group_by in GROUP_BY else None
+
+        for key, _desc in self.order_by:
+            if key not in SORT_COLUMNS:
+                raise ValueError(f"Недопустимый столбец сортировки: {key}")
+
+    def to_query(self, project_id):
+        """Запрос к таблице tasks с условиями и сортировкой фильтра"""
+        query = Query('tasks', TASK_COLUMNS).where('project_id', '=', project_id)
+
+        if self.statuses:
+            query.where_in('status', self.statuses)
+        if self.priorities:
+            query.where_in('priority', self.priorities)
+        if self.assignee:
+            query.where('assignee', '=', self.assignee)
+        if self.text:
+            # Так же, как TaskIndex: подстрока в названии без учёта регистра
+            query.where_contains('title', self.text)
+
+        # Порядок тот же, что у sort_tasks и group_tasks в памяти
+        if self.group_by == 'assignee':
+            # Без исполнителя (NULL и '') - одна группа
+            query.order_by('assignee', lower=True, null_as_empty=True)
+            query.order_by('assignee', null_as_empty=True)
+        elif self.group_by:
+            query.order_by(SORT_COLUMNS[self.group_by])
+        for key, desc in self.order_by:
+            query.order_by(SORT_COLUMNS[key], desc, lower=key in CASELESS_SORT)
+        return query.order_by('id', desc=True)
+
+
+class TaskIndex:
+    """Загруженные задачи с заранее построенными индексами для быстрого отбора"""
+
+    def __init__(self, tasks):
+        self.tasks = {task['id']: task for task in tasks}
+        self.titles = {task['id']: (task['title'] or '').lower() for task in tasks}
+        self.by_status = {}
+        self.by_priority = {}
+        self.by_assignee = {}
+        for task in tasks:
+            self.by_status.setdefault(task['status_code'], set()).add(task['id'])
+            self.by_priority.setdefault(task['priority_code'], set()).add(task['id'])
+            self.by_assignee.setdefault(task['assignee'] or '', set()).add(task['id'])
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def query(self, task_filter):
+        """Отбор и сортировка задач по фильтру"""
+        ids = None
+        if task_filter.statuses:
+            ids = self._union(self.by_status, task_filter.statuses)
+        if task_filter.priorities:
+            matched = self._union(self.by_priority, task_filter.priorities)
+            ids = matched if ids is None else ids & matched
+        if task_filter.assignee:
+            matched = self.by_assignee.get(task_filter.assignee, set())
+            ids = matched if ids is None else ids & matched
+        if ids is None:
+            ids = self.tasks.keys()
+        if task_filter.text:
+            needle = task_filter.text.lower()
+            ids = [task_id for task_id in ids if needle in self.titles[task_id]]
+
+        tasks = [self.tasks[task_id] for task_id in ids]
+        return sort_tasks(tasks, task_filter.order_by)
+
+    @staticmethod
+    def _union(index, values):
+        result = set()
+        for value in values:
+            result |= index.get(value, set())
+        return result
+
+
+def sort_tasks(tasks, order_by):
+    """Многоуровневая сортировка задач в памяти"""
+    tasks = sorted(tasks, key=lambda task: task['id'], reverse=True)
+    # Устойчивая сортировка: начинаем с последнего ключа
+    for key, desc in reversed(order_by):
+        field = SORT_KEYS[key]
+        tasks.sort(key=lambda task: _sort_value(task[field]), reverse=desc)
+    return tasks
+
+
+def group_tasks(tasks, group_by):
+    """Группировка отсортированных задач: [(ключ, название, задачи), ...]"""
+    if group_by == 'status':
+        key_field, label_field = 'status_code', 'status'
+    elif group_by == 'assignee':
+        key_field, label_field = 'assignee', 'assignee'
+    else:
+        return [(None, None, tasks)]
+
+    groups = {}
+    for task in tasks:
+        key = task[key_field] or ''
+        if key not in groups:
+            groups[key] = (key, task[label_field] or '', [])
+        groups[key][2].append(task)
+    # Группы, различающиеся только регистром, - в порядке самих строк, как в SQL
+    return [groups[key] for key in sorted(groups, key=lambda key: (_sort_value(key), key))]
+
+
+def _sort_value(value):
+    # None и пустые строки идут первыми, строки сравниваются без учёта регистра
+    if value is None:
+        return (0, '')
+    if isinstance(value, str):
+        return (1, value.lower())
+    return (1, value)
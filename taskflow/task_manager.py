@@ -1,11 +1,73 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+import change_log
+from archive import Archive
+from enums import Enumeration, seed_enumerations, STATUS_TODO, PRIORITY_MEDIUM
+from query_builder import unicode_lower
+
+# Текущая версия схемы (PRAGMA user_version)
+SCHEMA_VERSION = 5
+
+# Длина сохраняемого превью комментария
+PREVIEW_LENGTH = 50
+
+# Размер страницы при постраничной выборке комментариев
+COMMENTS_PAGE_SIZE = 50
+
+# Размер кэша подготовленных выражений на соединение
+CACHED_STATEMENTS = 128
+
+# Размер порции при потоковом чтении всех задач
+STREAM_CHUNK = 1000
+
+# Таблицы со столбцом version для оптимистичной блокировки
+VERSIONED_TABLES = ('projects', 'tasks', 'comments')
+
+# Сколько пар (id, version) проверять одним запросом
+VERSION_CHECK_BATCH = 400
+
+TASKS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        status INTEGER NOT NULL DEFAULT {status} REFERENCES statuses (id),
+        priority INTEGER NOT NULL DEFAULT {priority} REFERENCES priorities (id),
+        project_id INTEGER,
+        assignee TEXT,
+        due_date TEXT,
+        created_date TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (project_id) REFERENCES projects (id),
+        UNIQUE(title, project_id)
+    )
+'''
+
+# Столбцы строки задачи в порядке, который ожидает TaskManager._task_from_row
+TASK_COLUMNS = ('id', 'title', 'description', 'status', 'priority',
+                'project_id', 'assignee', 'due_date', 'created_date', 'version',
+                'comment_count', 'last_activity')
+
+TASK_SELECT = ", ".join(f"t.{column}" for column in TASK_COLUMNS)
+
+# Столбцы, доступные при потоковом чтении (iter_all_tasks)
+TASK_STREAM_COLUMNS = TASK_COLUMNS + ('project_name',)
+
+# Ключ обхода всех задач по убыванию (created_date, id)
+TASK_ORDER_KEY = "COALESCE(created_date, '')"
 
 class Database:
     """Класс для работы с базой данных"""
     
-    def __init__(self, db_name='tasks.db'):
+    def __init__(self, db_name='tasks.db', cached_statements=CACHED_STATEMENTS):
         self.db_name = db_name
+        self.cached_statements = cached_statements
+        self.statements = {}
+        # Постоянное соединение на каждый поток, чтобы кэш выражений не остывал
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
         self.init_db()
     
     def init_db(self):
@@ -23,22 +85,13 @@ class Database:
             )
         ''')
         
+        # Справочники статусов и приоритетов
+        seed_enumerations(cursor)
+        
         # Таблица задач
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                description TEXT,
-                status TEXT DEFAULT 'к выполнению',
-                priority TEXT DEFAULT 'средний',
-                project_id INTEGER,
-                assignee TEXT,
-                due_date TEXT,
-                created_date TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (project_id) REFERENCES projects (id),
-                UNIQUE(title, project_id)
-            )
-        ''')
+        cursor.execute(TASKS_TABLE_SQL.format(
+            name='tasks', status=STATUS_TODO, priority=PRIORITY_MEDIUM
+        ))
         
         # Таблица комментариев
         cursor.execute('''
@@ -52,47 +105,359 @@ class Database:
             )
         ''')
         
+        self.migrate(cursor)
+        
+        # Триггеры журнала изменений должны видеть новые столбцы
+        if change_log.is_enabled(cursor):
+            change_log.refresh_triggers(cursor)
+        
+        # Индексы для фильтрации и сортировки задач внутри проекта
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_priority ON tasks (project_id, priority)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_status ON tasks (project_id, status)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_assignee ON tasks (project_id, assignee)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_created ON tasks (project_id, created_date)")
+        
+        # Индекс для постраничного обхода всех задач по ключу
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_created ON tasks ({TASK_ORDER_KEY}, id)")
+        
+        # Дата смены статуса нужна архиву, чтобы находить давно выполненные задачи
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_date ON tasks (status, status_date)")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS tasks_status_date
+            AFTER UPDATE OF status ON tasks
+            WHEN NEW.status IS NOT OLD.status
+            BEGIN
+                UPDATE tasks SET status_date = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            END
+        ''')
+        
+        # Счётчик комментариев и время последней активности задачи
+        # поддерживаются триггерами, чтобы списки не считали их запросом на задачу
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_project_activity ON tasks (project_id, last_activity)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_activity ON tasks (last_activity)")
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS tasks_activity_insert
+            AFTER INSERT ON tasks
+            WHEN NEW.last_activity IS NULL
+            BEGIN
+                UPDATE tasks SET last_activity = COALESCE(NEW.created_date, CURRENT_TIMESTAMP)
+                WHERE id = NEW.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS tasks_activity_update
+            AFTER UPDATE OF title, description, status, priority, assignee, due_date ON tasks
+            BEGIN
+                UPDATE tasks SET last_activity = CURRENT_TIMESTAMP WHERE id = NEW.id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS comments_activity_insert
+            AFTER INSERT ON comments
+            BEGIN
+                UPDATE tasks SET comment_count = comment_count + 1, last_activity = CURRENT_TIMESTAMP
+                WHERE id = NEW.task_id;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS comments_activity_delete
+            AFTER DELETE ON comments
+            BEGIN
+                UPDATE tasks SET comment_count = comment_count - 1, last_activity = CURRENT_TIMESTAMP
+                WHERE id = OLD.task_id;
+            END
+        ''')
+        
+        # Индекс для постраничной выборки веток комментариев
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_comments_thread ON comments (task_id, parent_id, created_date)")
+        
         conn.commit()
         conn.close()
     
+    def migrate(self, cursor):
+        """Обновление схемы существующей базы данных"""
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        
+        if version < 1:
+            self._migrate_enum_codes(cursor)
+        if version < 2:
+            self._migrate_comment_threads(cursor)
+        if version < 3:
+            self._add_column(cursor, 'tasks', 'status_date', 'TEXT')
+        if version < 4:
+            # Версия строки растёт при каждом изменении (оптимистичная блокировка)
+            for table in VERSIONED_TABLES:
+                self._add_column(cursor, table, 'version', 'INTEGER NOT NULL DEFAULT 1')
+        if version < 5:
+            self._migrate_task_activity(cursor)
+        
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    
+    def _migrate_enum_codes(self, cursor):
+        """Перевод текстовых статусов и приоритетов в целочисленные коды"""
+        columns = {row[1]: row[2] for row in cursor.execute("PRAGMA table_info(tasks)")}
+        if columns.get('status', '').upper() == 'INTEGER':
+            return
+        
+        # Нераспознанные значения получат код по умолчанию, но исходный
+        # текст сохраняется в legacy_enum_values, чтобы его можно было разобрать
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS legacy_enum_values (
+                task_id INTEGER NOT NULL,
+                enum TEXT NOT NULL,
+                value TEXT,
+                PRIMARY KEY (task_id, enum)
+            )
+        ''')
+        for enum, column in (('statuses', 'status'), ('priorities', 'priority')):
+            cursor.execute(f'''
+                INSERT OR REPLACE INTO legacy_enum_values (task_id, enum, value)
+                SELECT t.id, ?, t.{column} FROM tasks t
+                WHERE NOT EXISTS (SELECT 1 FROM {enum} e WHERE e.key = t.{column})
+                  AND NOT EXISTS (SELECT 1 FROM enum_labels l
+                                  WHERE l.enum = ? AND l.label = t.{column})
+            ''', (enum, enum))
+        unmapped = cursor.execute(
+            "SELECT enum, value, COUNT(*) FROM legacy_enum_values GROUP BY enum, value"
+        ).fetchall()
+        for enum, value, count in unmapped:
+            print(f"Migration warning: {enum} value {value!r} is unknown ({count} tasks), "
+                  f"saved in legacy_enum_values")
+        
+        # SQLite не умеет менять тип столбца, поэтому пересоздаём таблицу
+        cursor.execute(TASKS_TABLE_SQL.format(
+            name='tasks_new', status=STATUS_TODO, priority=PRIORITY_MEDIUM
+        ))
+        cursor.execute(f'''
+            INSERT INTO tasks_new (id, title, description, status, priority,
+                                   project_id, assignee, due_date, created_date)
+            SELECT t.id, t.title, t.description,
+                   COALESCE((SELECT s.id FROM statuses s
+                             WHERE s.key = t.status OR s.id IN (
+                                 SELECT code FROM enum_labels
+                                 WHERE enum = 'statuses' AND label = t.status)), {STATUS_TODO}),
+                   COALESCE((SELECT p.id FROM priorities p
+                             WHERE p.key = t.priority OR p.id IN (
+                                 SELECT code FROM enum_labels
+                                 WHERE enum = 'priorities' AND label = t.priority)), {PRIORITY_MEDIUM}),
+                   t.project_id, t.assignee, t.due_date, t.created_date
+            FROM tasks t
+        ''')
+        cursor.execute("DROP TABLE tasks")
+        cursor.execute("ALTER TABLE tasks_new RENAME TO tasks")
+    
+    def _migrate_comment_threads(self, cursor):
+        """Ответы на комментарии и сохранённое превью текста"""
+        self._add_column(cursor, 'comments', 'parent_id', 'INTEGER REFERENCES comments (id)')
+        self._add_column(cursor, 'comments', 'preview', 'TEXT')
+        self._add_column(cursor, 'comments', 'length', 'INTEGER NOT NULL DEFAULT 0')
+        cursor.execute(
+            "UPDATE comments SET preview = COALESCE(substr(text, 1, ?), ''), length = COALESCE(length(text), 0)",
+            (PREVIEW_LENGTH,)
+        )
+    
+    def _migrate_task_activity(self, cursor):
+        """Количество комментариев и время последней активности задачи"""
+        self._add_column(cursor, 'tasks', 'comment_count', 'INTEGER NOT NULL DEFAULT 0')
+        self._add_column(cursor, 'tasks', 'last_activity', 'TEXT')
+        cursor.execute('''
+            UPDATE tasks SET
+                comment_count = (SELECT COUNT(*) FROM comments c WHERE c.task_id = tasks.id),
+                last_activity = MAX(
+                    COALESCE(created_date, ''),
+                    COALESCE(status_date, ''),
+                    COALESCE((SELECT MAX(c.created_date) FROM comments c WHERE c.task_id = tasks.id), '')
+                )
+        ''')
+    
+    def _add_column(self, cursor, table, column, definition):
+        """Добавление столбца, если его ещё нет"""
+        columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    
+    @property
+    def connection(self):
+        """Соединение текущего потока"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_name,
+                cached_statements=self.cached_statements,
+                check_same_thread=False
+            )
+            conn.create_function('unicode_lower', 1, unicode_lower, deterministic=True)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+    
+    def attach(self, alias, path):
+        """Подключение (ATTACH) дополнительной базы к соединению текущего потока"""
+        conn = self.connection
+        attached = getattr(self._local, 'attached', None)
+        if attached is None:
+            attached = self._local.attached = set()
+        if alias not in attached:
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+            attached.add(alias)
+        return conn
+    
+    def close(self):
+        """Закрытие соединений всех потоков"""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+    
+    def prepare(self, statements):
+        """Регистрация именованных запросов {имя: SQL}"""
+        self.statements.update(statements)
+    
+    def _sql(self, query):
+        # Вместо текста запроса можно передать имя зарегистрированного запроса
+        return self.statements.get(query, query)
+    
+    @property
+    def in_transaction(self):
+        """Открыта ли транзакция через transaction() в текущем потоке"""
+        return getattr(self._local, 'depth', 0) > 0
+    
+    @contextmanager
+    def transaction(self):
+        """Несколько запросов одной транзакцией (вложенные вызовы объединяются)"""
+        conn = self.connection
+        depth = getattr(self._local, 'depth', 0)
+        if depth == 0 and not conn.in_transaction:
+            # Сразу берём блокировку записи, чтобы не получить SQLITE_BUSY посреди пакета
+            conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = depth + 1
+        try:
+            yield conn
+            if depth == 0:
+                conn.commit()
+        except Exception:
+            if depth == 0:
+                conn.rollback()
+            raise
+        finally:
+            self._local.depth = depth
+    
     def execute_query(self, query, params=()):
         """Выполнение запроса"""
+        return self._execute(query, params) is not None
+    
+    def execute_update(self, query, params=()):
+        """Выполнение запроса; возвращает количество изменённых строк (0 при ошибке)"""
+        cursor = self._execute(query, params)
+        return cursor.rowcount if cursor is not None else 0
+    
+    def _execute(self, query, params):
+        conn = self.connection
         try:
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            conn.commit()
-            conn.close()
-            return True
+            cursor = conn.execute(self._sql(query), params)
+            if not self.in_transaction:
+                conn.commit()
+            return cursor
         except sqlite3.IntegrityError:
-            return False
+            # Внутри transaction() SQLite уже отменил только этот запрос
+            if not self.in_transaction:
+                conn.rollback()
+            return None
         except Exception as e:
+            if not self.in_transaction:
+                conn.rollback()
             print(f"Database error: {e}")
-            return False
+            return None
     
     def fetch_all(self, query, params=()):
         """Получение всех записей"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
-        result = cursor.fetchall()
-        conn.close()
-        return result
+        return self.connection.execute(self._sql(query), params).fetchall()
     
     def fetch_one(self, query, params=()):
         """Получение одной записи"""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-        cursor.execute(query, params)
+        cursor = self.connection.execute(self._sql(query), params)
         result = cursor.fetchone()
-        conn.close()
+        # Незакрытый курсор удерживал бы блокировку чтения
+        cursor.close()
         return result
+    
+    def iterate(self, query, params=()):
+        """Курсор для построчного чтения результата
+        
+        Пока курсор не дочитан, база удерживает блокировку чтения.
+        """
+        return self.connection.execute(self._sql(query), params)
+
+# Частые запросы TaskManager; по имени они всегда дают один и тот же текст
+# SQL и переиспользуются из кэша подготовленных выражений соединения
+STATEMENTS = {
+    'task_exists': "SELECT 1 FROM tasks WHERE title = ? AND project_id = ? LIMIT 1",
+    'task_id': "SELECT id FROM tasks WHERE title = ? AND project_id = ?",
+    'task_by_id': f"SELECT {TASK_SELECT} FROM tasks t WHERE id = ?",
+    'count_tasks': "SELECT COUNT(*) FROM tasks WHERE project_id = ?",
+    'tasks_by_project': f"SELECT {TASK_SELECT} FROM tasks t WHERE project_id = ? ORDER BY created_date DESC",
+    'insert_task': """INSERT INTO tasks (title, description, project_id, assignee, priority, due_date) 
+                      VALUES (?, ?, ?, ?, ?, ?)""",
+    'update_task_status': "UPDATE tasks SET status = ?, version = version + 1 WHERE id = ?",
+    'update_task_status_cas': """UPDATE tasks SET status = ?, version = version + 1
+                                 WHERE id = ? AND version = ?""",
+    'insert_comment': """INSERT INTO comments (task_id, author, text, parent_id, preview, length) 
+                         VALUES (?, ?, ?, ?, ?, ?)""",
+    'comment_text': "SELECT text FROM comments WHERE id = ?",
+    'comment_previews': """SELECT c.id, c.task_id, c.parent_id, c.author, c.preview, c.length, c.created_date,
+                                  (SELECT COUNT(*) FROM comments r
+                                   WHERE r.task_id = c.task_id AND r.parent_id = c.id) AS replies,
+                                  c.version
+                           FROM comments c
+                           WHERE c.task_id = ? AND c.parent_id IS ?
+                           ORDER BY c.created_date DESC, c.id DESC
+                           LIMIT ? OFFSET ?""",
+}
 
 class TaskManager:
     """Основной класс для управления задачами"""
     
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db_name='tasks.db', cached_statements=CACHED_STATEMENTS):
+        self.db = Database(db_name, cached_statements)
+        self.db.prepare(STATEMENTS)
+        self.statuses = Enumeration.load(self.db, 'statuses')
+        self.priorities = Enumeration.load(self.db, 'priorities')
+        self.archive = Archive(self.db)
+    
+    def close(self):
+        """Закрытие соединений с базой данных"""
+        self.db.close()
+    
+    # Справочники
+    def get_statuses(self, locale='ru'):
+        """Названия статусов в порядке сортировки"""
+        return self.statuses.labels(locale)
+    
+    def get_priorities(self, locale='ru'):
+        """Названия приоритетов в порядке сортировки"""
+        return self.priorities.labels(locale)
+    
+    def _task_from_row(self, row, archived=False):
+        """Преобразование строки таблицы задач в словарь"""
+        return {
+            'id': row[0],
+            'title': row[1],
+            'description': row[2],
+            'status': self.statuses.label(row[3]),
+            'priority': self.priorities.label(row[4]),
+            'status_code': row[3],
+            'priority_code': row[4],
+            'project_id': row[5],
+            'assignee': row[6],
+            'due_date': row[7],
+            'created_date': row[8],
+            'version': row[9],
+            'comment_count': row[10],
+            'last_activity': row[11],
+            'archived': archived
+        }
     
     # Проекты
     def create_project(self, name, description=""):
@@ -102,7 +467,7 @@ class TaskManager:
     
     def get_all_projects(self):
         """Получение всех проектов"""
-        query = "SELECT * FROM projects ORDER BY created_date DESC"
+        query = "SELECT id, name, description, created_date, version FROM projects ORDER BY created_date DESC"
         results = self.db.fetch_all(query)
         projects = []
         for row in results:
@@ -110,86 +475,334 @@ class TaskManager:
                 'id': row[0],
                 'name': row[1],
                 'description': row[2],
-                'created_date': row[3]
+                'created_date': row[3],
+                'version': row[4]
             })
         return projects
     
-    def delete_project(self, project_id):
-        """Удаление проекта"""
-        # Сначала удаляем все задачи проекта
-        self.db.execute_query("DELETE FROM tasks WHERE project_id = ?", (project_id,))
-        # Затем удаляем проект
-        self.db.execute_query("DELETE FROM projects WHERE id = ?", (project_id,))
+    def find_project(self, reference):
+        """Проект по ID или названию (по индексу, без выборки всех проектов)
+        
+        Возвращает словарь, как в get_all_projects, или None. ID имеет
+        приоритет над названием.
+        """
+        query = '''SELECT id, name, description, created_date, version FROM projects
+                   WHERE id = ? OR name = ? ORDER BY id = ? DESC LIMIT 1'''
+        row = self.db.fetch_one(query, (str(reference), str(reference), str(reference)))
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'name': row[1],
+            'description': row[2],
+            'created_date': row[3],
+            'version': row[4]
+        }
+    
+    def delete_project(self, project_id, expected_version=None):
+        """Удаление проекта вместе с задачами
+        
+        С expected_version проект удаляется, только если его версия не
+        изменилась; при конфликте возвращается False.
+        """
+        # ATTACH архива невозможен внутри транзакции
+        if self.archive.exists():
+            self.archive.connect()
+        with self.db.transaction() as conn:
+            if not self._delete_versioned(conn, 'projects', project_id, expected_version):
+                return False
+            # Вместе с проектом удаляем его задачи, в том числе архивные
+            self.archive.purge_project(project_id)
+            conn.execute(
+                "DELETE FROM comments WHERE task_id IN (SELECT id FROM tasks WHERE project_id = ?)",
+                (project_id,)
+            )
+            conn.execute("DELETE FROM tasks WHERE project_id = ?", (project_id,))
+        return True
     
     # Задачи
     def create_task(self, title, project_id, description="", assignee="", priority="средний", due_date=None):
         """Создание новой задачи"""
         # Проверка на дубликаты
-        check_query = "SELECT id FROM tasks WHERE title = ? AND project_id = ?"
-        existing_task = self.db.fetch_one(check_query, (title, project_id))
+        if self.task_exists(title, project_id):
+            return False
         
-        if existing_task:
+        priority_code = self.priorities.code(priority)
+        if priority_code is None:
             return False
         
-        query = """INSERT INTO tasks (title, description, project_id, assignee, priority, due_date) 
-                   VALUES (?, ?, ?, ?, ?, ?)"""
-        return self.db.execute_query(query, (title, description, project_id, assignee, priority, due_date))
+        return self.db.execute_query('insert_task', (title, description, project_id, assignee, priority_code, due_date))
     
-    def get_tasks_by_project(self, project_id):
-        """Получение задач по проекту"""
-        query = "SELECT * FROM tasks WHERE project_id = ? ORDER BY created_date DESC"
-        results = self.db.fetch_all(query, (project_id,))
-        tasks = []
-        for row in results:
-            tasks.append({
-                'id': row[0],
-                'title': row[1],
-                'description': row[2],
-                'status': row[3],
-                'priority': row[4],
-                'project_id': row[5],
-                'assignee': row[6],
-                'due_date': row[7],
-                'created_date': row[8]
-            })
+    def get_tasks_by_project(self, project_id, include_archived=False):
+        """Получение задач по проекту (include_archived - вместе с архивными)"""
+        results = self.db.fetch_all('tasks_by_project', (project_id,))
+        tasks = [self._task_from_row(row) for row in results]
+        if include_archived:
+            tasks.extend(self._task_from_row(row, archived=True)
+                         for row in self.archive.get_tasks(project_id, TASK_COLUMNS))
+            tasks.sort(key=lambda task: task['created_date'] or '', reverse=True)
         return tasks
     
-    def get_all_tasks(self):
-        """Получение всех задач"""
-        query = """SELECT t.*, p.name as project_name 
+    def count_tasks(self, project_id):
+        """Количество задач в проекте"""
+        return self.db.fetch_one('count_tasks', (project_id,))[0]
+    
+    def select(self, query):
+        """Курсор по запросу из построителя Query (строки читаются по мере обхода)"""
+        return self.db.iterate(*query.build())
+    
+    def query_tasks(self, project_id, task_filter, limit=None, offset=0):
+        """Задачи проекта с фильтрами и сортировкой (TaskFilter)"""
+        query = task_filter.to_query(project_id)
+        if limit is not None:
+            query.limit(limit, offset)
+        return [self._task_from_row(row) for row in self.select(query)]
+    
+    def count_task_groups(self, project_id, task_filter):
+        """Количество задач по фильтру: {ключ группы: количество}
+        
+        Без группировки в фильтре - {None: всего}. Ключи те же, что у
+        task_filter.group_tasks, поэтому счётчики не зависят от того,
+        сколько задач загружено.
+        """
+        query = task_filter.to_query(project_id)
+        rows = self.db.fetch_all(*query.build_count(task_filter.group_by))
+        if task_filter.group_by is None:
+            return {None: rows[0][0]}
+        counts = {}
+        for key, count in rows:
+            counts[key or ''] = counts.get(key or '', 0) + count
+        return counts
+    
+    def get_all_tasks(self, include_archived=False):
+        """Получение всех задач (столбцы TASK_COLUMNS и название проекта)
+        
+        Статус и приоритет в строках - названия, как в get_tasks_by_project,
+        а не коды.
+        """
+        query = f"""SELECT {TASK_SELECT}, p.name as project_name 
                    FROM tasks t 
-                   LEFT JOIN projects p ON t.project_id = p.id 
-                   ORDER BY t.created_date DESC"""
-        return self.db.fetch_all(query)
-    
-    def update_task_status(self, task_id, new_status):
-        """Обновление статуса задачи"""
-        query = "UPDATE tasks SET status = ? WHERE id = ?"
-        self.db.execute_query(query, (new_status, task_id))
-    
-    def delete_task(self, task_id):
-        """Удаление задачи"""
-        # Сначала удаляем комментарии задачи
-        self.db.execute_query("DELETE FROM comments WHERE task_id = ?", (task_id,))
-        # Затем удаляем задачу
-        self.db.execute_query("DELETE FROM tasks WHERE id = ?", (task_id,))
+                   LEFT JOIN projects p ON t.project_id = p.id"""
+        if include_archived and self.archive.exists():
+            self.archive.connect()
+            query += f"""
+                   UNION ALL
+                   SELECT {TASK_SELECT}, p.name
+                   FROM archive.tasks t
+                   LEFT JOIN projects p ON t.project_id = p.id
+                   ORDER BY 9 DESC"""  # created_date; имя неоднозначно из-за JOIN
+        else:
+            query += " ORDER BY t.created_date DESC"
+        return self.label_task_rows(self.db.fetch_all(query))
+    
+    def label_task_rows(self, rows):
+        """Строки задач (столбцы TASK_COLUMNS) с названиями статуса и приоритета вместо кодов"""
+        statuses = {code: self.statuses.label(code) for code in self.statuses.codes()}
+        priorities = {code: self.priorities.label(code) for code in self.priorities.codes()}
+        return [tuple(row[:3]) + (statuses.get(row[3], row[3]), priorities.get(row[4], row[4])) + tuple(row[5:])
+                for row in rows]
+    
+    def iter_all_tasks(self, columns=TASK_STREAM_COLUMNS, chunk_size=STREAM_CHUNK):
+        """Все задачи по убыванию даты создания, строка за строкой
+        
+        В отличие от get_all_tasks результат не загружается целиком: задачи
+        читаются порциями по chunk_size, и в строках только столбцы columns.
+        """
+        for chunk in self.iter_task_chunks(columns, chunk_size):
+            yield from chunk
+    
+    def iter_task_chunks(self, columns=TASK_STREAM_COLUMNS, chunk_size=STREAM_CHUNK, keyed=False):
+        """Порции задач для iter_all_tasks (keyed - строки вида (ключ, строка))"""
+        strings = {}
+        # Словарь проектов строится один раз на весь обход, а не на каждую порцию
+        project_names = self.project_names(strings) if 'project_name' in columns else None
+        cursor = None
+        while True:
+            chunk, cursor = self.fetch_tasks_page(columns, chunk_size, cursor, keyed, strings, project_names)
+            if chunk:
+                yield chunk
+            if cursor is None:
+                return
+    
+    def project_names(self, strings=None):
+        """Словарь {ID проекта: название}; строки общие через словарь strings"""
+        strings = {} if strings is None else strings
+        return {
+            project_id: strings.setdefault(name, name)
+            for project_id, name in self.db.fetch_all("SELECT id, name FROM projects")
+        }
+    
+    def fetch_tasks_page(self, columns, limit, cursor=None, keyed=False, strings=None, project_names=None):
+        """Страница задач после курсора (created_date, id) и курсор следующей
+        
+        Название проекта берётся из словаря проектов project_names (без него
+        словарь читается заново), а не из JOIN, поэтому все задачи проекта
+        ссылаются на одну строку. Исполнители тоже приводятся к одному
+        объекту через словарь strings.
+        """
+        unknown = set(columns) - set(TASK_STREAM_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные столбцы: {', '.join(sorted(unknown))}")
+        selected = ['project_id' if column == 'project_name' else column for column in columns]
+        query = f"SELECT {TASK_ORDER_KEY}, id, {', '.join(selected)} FROM tasks"
+        params = []
+        if cursor is not None:
+            # Условие в такой форме SQLite выполняет поиском по idx_tasks_created
+            query += f" WHERE {TASK_ORDER_KEY} <= ? AND ({TASK_ORDER_KEY} < ? OR id < ?)"
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        query += f" ORDER BY {TASK_ORDER_KEY} DESC, id DESC LIMIT ?"
+        params.append(limit)
+        rows = self.db.fetch_all(query, params)
+        
+        if strings is None:
+            strings = {}
+        if 'project_name' not in columns:
+            project_names = None
+        elif project_names is None:
+            project_names = self.project_names(strings)
+        assignee = columns.index('assignee') + 2 if 'assignee' in columns else None
+        project = columns.index('project_name') + 2 if project_names is not None else None
+        
+        page = []
+        for row in rows:
+            values = list(row[2:])
+            if assignee is not None and row[assignee] is not None:
+                values[assignee - 2] = strings.setdefault(row[assignee], row[assignee])
+            if project is not None:
+                values[project - 2] = project_names.get(row[project])
+            page.append(((row[0], row[1]), tuple(values)) if keyed else tuple(values))
+        next_cursor = (rows[-1][0], rows[-1][1]) if len(rows) == limit else None
+        return page, next_cursor
+    
+    def get_most_active_tasks(self, limit=20, project_id=None):
+        """Задачи с самой свежей активностью (один запрос по индексу)"""
+        if project_id is None:
+            query = f"SELECT {TASK_SELECT} FROM tasks t ORDER BY last_activity DESC LIMIT ?"
+            params = (limit,)
+        else:
+            query = (f"SELECT {TASK_SELECT} FROM tasks t WHERE project_id = ? "
+                     f"ORDER BY last_activity DESC LIMIT ?")
+            params = (project_id, limit)
+        return [self._task_from_row(row) for row in self.db.fetch_all(query, params)]
+    
+    def search_tasks(self, text, project_id=None, include_archived=False):
+        """Поиск задач по подстроке в названии и описании"""
+        # LIKE не различает регистр только для ASCII, поэтому сравниваем unicode_lower
+        needle = text.lower()
+        condition = ("(instr(unicode_lower(t.title), ?) > 0 "
+                     "OR instr(unicode_lower(t.description), ?) > 0)")
+        params = [needle, needle]
+        if project_id is not None:
+            condition += " AND t.project_id = ?"
+            params.append(project_id)
+        
+        query = f"SELECT {TASK_SELECT}, 0 FROM tasks t WHERE {condition}"
+        if include_archived and self.archive.exists():
+            self.archive.connect()
+            query += f" UNION ALL SELECT {TASK_SELECT}, 1 FROM archive.tasks t WHERE {condition}"
+            params = params * 2
+        query += " ORDER BY created_date DESC"
+        return [self._task_from_row(row, archived=bool(row[len(TASK_COLUMNS)]))
+                for row in self.db.fetch_all(query, params)]
+    
+    # Архив
+    def archive_completed(self, days=30, project_id=None):
+        """Перенос в архив задач, выполненных более days дней назад"""
+        return self.archive.archive_completed(days, project_id)
+    
+    def restore_archived_task(self, task_id):
+        """Возврат задачи из архива вместе с комментариями"""
+        if not self.archive.exists():
+            return False
+        try:
+            return self.archive.restore_tasks([task_id]) == 1
+        except sqlite3.IntegrityError:
+            # За время хранения в архиве появилась задача с тем же названием
+            return False
+    
+    def update_task_status(self, task_id, new_status, expected_version=None):
+        """Обновление статуса задачи
+        
+        С expected_version статус меняется, только если задачу никто не
+        изменил после чтения; при конфликте возвращается False.
+        """
+        status_code = self.statuses.code(new_status)
+        if status_code is None:
+            return False
+        if expected_version is None:
+            return self.db.execute_update('update_task_status', (status_code, task_id)) > 0
+        return self.db.execute_update('update_task_status_cas', (status_code, task_id, expected_version)) > 0
+    
+    def delete_task(self, task_id, expected_version=None):
+        """Удаление задачи вместе с комментариями (expected_version - как в update_task_status)"""
+        with self.db.transaction() as conn:
+            if not self._delete_versioned(conn, 'tasks', task_id, expected_version):
+                return False
+            conn.execute("DELETE FROM comments WHERE task_id = ?", (task_id,))
+        return True
+    
+    def _delete_versioned(self, conn, table, row_id, expected_version):
+        """Удаление строки, при expected_version - только этой версии"""
+        query = f"DELETE FROM {table} WHERE id = ?"
+        params = [row_id]
+        if expected_version is not None:
+            query += " AND version = ?"
+            params.append(expected_version)
+        return conn.execute(query, params).rowcount > 0
+    
+    def stale_rows(self, table, versions):
+        """ID строк, изменённых или удалённых с момента чтения
+        
+        versions - словарь {id: version} или пары (id, version) из кэша
+        клиента. Вместо перечитывания списка достаточно перечитать только
+        возвращённые строки.
+        """
+        if table not in VERSIONED_TABLES:
+            raise ValueError(f"Таблица без версий: {table}")
+        pairs = list(versions.items()) if isinstance(versions, dict) else list(versions)
+        stale = set()
+        for start in range(0, len(pairs), VERSION_CHECK_BATCH):
+            chunk = pairs[start:start + VERSION_CHECK_BATCH]
+            values = ", ".join(["(?, ?)"] * len(chunk))
+            rows = self.db.fetch_all(
+                f"""WITH cached(id, version) AS (VALUES {values})
+                    SELECT cached.id FROM cached
+                    LEFT JOIN {table} r ON r.id = cached.id
+                    WHERE r.version IS NOT cached.version""",
+                [value for pair in chunk for value in pair]
+            )
+            stale.update(row[0] for row in rows)
+        return stale
+    
+    def get_task(self, task_id):
+        """Задача по ID или None"""
+        row = self.db.fetch_one('task_by_id', (task_id,))
+        return self._task_from_row(row) if row else None
     
     def task_exists(self, title, project_id):
         """Проверка существования задачи"""
-        query = "SELECT id FROM tasks WHERE title = ? AND project_id = ?"
-        result = self.db.fetch_one(query, (title, project_id))
-        return result is not None
+        return self.db.fetch_one('task_exists', (title, project_id)) is not None
+    
+    def find_task_id(self, title, project_id):
+        """ID задачи по названию в проекте"""
+        result = self.db.fetch_one('task_id', (title, project_id))
+        return result[0] if result else None
     
     # Комментарии
-    def add_comment(self, task_id, author, text):
-        """Добавление комментария к задаче"""
-        query = "INSERT INTO comments (task_id, author, text) VALUES (?, ?, ?)"
-        return self.db.execute_query(query, (task_id, author, text))
-    
-    def get_comments(self, task_id):
-        """Получение комментариев задачи"""
-        query = "SELECT * FROM comments WHERE task_id = ? ORDER BY created_date DESC"
+    def add_comment(self, task_id, author, text, parent_id=None):
+        """Добавление комментария к задаче (parent_id - ответ на комментарий)"""
+        return self.db.execute_query('insert_comment', (
+            task_id, author, text, parent_id, text[:PREVIEW_LENGTH], len(text)
+        ))
+    
+    def get_comments(self, task_id, include_archived=False):
+        """Получение комментариев задачи (include_archived - и для архивной задачи)"""
+        query = """SELECT id, task_id, author, text, created_date, parent_id, version 
+                   FROM comments WHERE task_id = ? ORDER BY created_date DESC"""
         results = self.db.fetch_all(query, (task_id,))
+        if not results and include_archived and self.archive.exists():
+            self.archive.connect()
+            results = self.db.fetch_all(query.replace("FROM comments", "FROM archive.comments"), (task_id,))
         comments = []
         for row in results:
             comments.append({
@@ -197,10 +810,57 @@ class TaskManager:
                 'task_id': row[1],
                 'author': row[2],
                 'text': row[3],
-                'created_date': row[4]
+                'created_date': row[4],
+                'parent_id': row[5],
+                'version': row[6]
+            })
+        return comments
+    
+    def get_comment_previews(self, task_id, parent_id=None, limit=COMMENTS_PAGE_SIZE, offset=0):
+        """Страница комментариев ветки без полного текста
+        
+        parent_id=None возвращает комментарии верхнего уровня.
+        """
+        results = self.db.fetch_all('comment_previews', (task_id, parent_id, limit, offset))
+        comments = []
+        for row in results:
+            comments.append({
+                'id': row[0],
+                'task_id': row[1],
+                'parent_id': row[2],
+                'author': row[3],
+                'preview': row[4] or '',
+                'length': row[5],
+                'created_date': row[6],
+                'replies': row[7],
+                'version': row[8]
             })
         return comments
     
-    def delete_comment(self, comment_id):
-        """Удаление комментария"""
-        self.db.execute_query("DELETE FROM comments WHERE id = ?", (comment_id,))
\ No newline at end of file
+    def get_comment_text(self, comment_id):
+        """Полный текст комментария"""
+        result = self.db.fetch_one('comment_text', (comment_id,))
+        return result[0] if result else None
+    
+    def delete_comment(self, comment_id, expected_version=None):
+        """Удаление комментария вместе с ответами на него
+        
+        С expected_version ветка удаляется, только если сам комментарий не
+        менялся после чтения; при конфликте возвращается False.
+        """
+        with self.db.transaction() as conn:
+            if expected_version is not None:
+                row = conn.execute("SELECT version FROM comments WHERE id = ?", (comment_id,)).fetchone()
+                if row is None or row[0] != expected_version:
+                    return False
+            deleted = conn.execute("""
+                DELETE FROM comments WHERE id IN (
+                    WITH RECURSIVE thread(id) AS (
+                        SELECT ?
+                        UNION ALL
+                        SELECT c.id FROM comments c JOIN thread t ON c.parent_id = t.id
+                    )
+                    SELECT id FROM thread
+                )
+            """, (comment_id,)).rowcount
+        return deleted > 0
\ No newline at end of file
@@ -0,0 +1,277 @@
+"""Рабочие пространства: отдельная база данных на каждый отдел
+
+Каждое пространство - свой файл <каталог>/<имя>.db со своими проектами,
+блокировками и архивом. WorkspaceRegistry открывает TaskManager нужного
+пространства и держит ограниченное число открытых менеджеров: давно не
+использованные закрываются (LRU и тайм-аут простоя, который проверяет
+фоновый поток). Менеджер, выданный open() или get(), не закрывается, пока
+его не вернули. Запросы администратора выполняются по всем пространствам
+параллельно в общем пуле потоков.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from task_manager import TaskManager
+
+WORKSPACE_NAME = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$')
+
+# Сколько менеджеров держать открытыми и через сколько секунд простоя закрывать
+MAX_OPEN_WORKSPACES = 8
+IDLE_TIMEOUT = 300
+
+# Параллельность запросов по всем пространствам
+ADMIN_WORKERS = 4
+
+
+def workspace_name(name):
+    """Проверка имени пространства (оно же имя файла)"""
+    if not WORKSPACE_NAME.match(name or '') or name.endswith('_archive'):
+        raise ValueError(f"Недопустимое имя пространства: {name!r}")
+    return name
+
+
+class WorkspaceRegistry:
+    """Пространства в каталоге root и кэш открытых TaskManager"""
+
+    def __init__(self, root='workspaces', max_open=MAX_OPEN_WORKSPACES, idle_timeout=IDLE_TIMEOUT):
+        self.root = root
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        # имя -> [менеджер, время последнего обращения, число активных пользователей]
+        self._open = OrderedDict()
+        self._lock = threading.Lock()
+        # имя -> блокировка открытия: миграции одного пространства выполняет
+        # один поток, а остальные пространства в это время доступны
+        self._opening = {}
+        # Потоки пула постоянные: у каждого менеджера не больше ADMIN_WORKERS
+        # соединений от запросов администратора
+        self.pool = ThreadPoolExecutor(max_workers=ADMIN_WORKERS, thread_name_prefix='workspace')
+        self._stop = threading.Event()
+        self._reaper = None
+        if idle_timeout:
+            self._reaper = threading.Thread(target=self._reap, name='workspace-reaper', daemon=True)
+            self._reaper.start()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, name):
+        """Файл базы данных пространства"""
+        return os.path.join(self.root, f"{workspace_name(name)}.db")
+
+    def exists(self, name):
+        """Есть ли пространство"""
+        return os.path.exists(self.path(name))
+
+    def names(self):
+        """Имена всех пространств"""
+        names = []
+        for file_name in os.listdir(self.root):
+            stem, ext = os.path.splitext(file_name)
+            if ext == '.db' and WORKSPACE_NAME.match(stem) and not stem.endswith('_archive'):
+                names.append(stem)
+        return sorted(names)
+
+    def create(self, name):
+        """Создание пространства; возвращает False, если оно уже есть"""
+        if self.exists(name):
+            return False
+        with self.open(name, create=True):
+            return True
+
+    # Открытые менеджеры
+    @contextmanager
+    def open(self, name, create=False):
+        """TaskManager пространства на время блока with
+
+        Пока блок выполняется, менеджер не будет закрыт вытеснением.
+        """
+        manager = self._acquire(name, create)
+        try:
+            yield manager
+        finally:
+            self._release(name)
+
+    def get(self, name, create=False):
+        """TaskManager пространства для долгого использования
+
+        Менеджер не будет закрыт вытеснением, пока для каждого get() не
+        вызван release(name).
+        """
+        return self._acquire(name, create)
+
+    def release(self, name):
+        """Возврат менеджера, полученного через get()"""
+        self._release(name)
+
+    def _acquire(self, name, create):
+        path = self.path(name)
+        with self._lock:
+            entry = self._open.get(name)
+            if entry is not None:
+                return self._pin(name, entry)
+            opening = self._opening.setdefault(name, threading.Lock())
+
+        # База открывается и мигрирует вне общей блокировки реестра
+        with opening:
+            with self._lock:
+                entry = self._open.get(name)
+                if entry is not None:
+                    return self._pin(name, entry)
+            if not create and not os.path.exists(path):
+                raise KeyError(f"Пространство не найдено: {name}")
+            manager = TaskManager(path)
+            with self._lock:
+                entry = self._open[name] = [manager, 0.0, 0]
+                return self._pin(name, entry)
+
+    def _pin(self, name, entry):
+        """Отметка обращения к менеджеру (вызывается под блокировкой)"""
+        self._open.move_to_end(name)
+        entry[1] = time.monotonic()
+        entry[2] += 1
+        self._evict()
+        return entry[0]
+
+    def _release(self, name):
+        with self._lock:
+            entry = self._open.get(name)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                entry[2] -= 1
+            self._evict()
+
+    def _evict(self):
+        """Закрытие простаивающих и лишних менеджеров (вызывается под блокировкой)"""
+        now = time.monotonic()
+        for name, (manager, last_used, users) in list(self._open.items()):
+            if users:
+                continue
+            if len(self._open) > self.max_open or now - last_used > self.idle_timeout:
+                manager.close()
+                del self._open[name]
+
+    def evict_idle(self):
+        """Закрытие менеджеров, простаивающих дольше idle_timeout"""
+        with self._lock:
+            self._evict()
+
+    def _reap(self):
+        # Простой проверяется и тогда, когда к реестру никто не обращается
+        while not self._stop.wait(max(self.idle_timeout / 2, 1)):
+            self.evict_idle()
+
+    def open_names(self):
+        """Имена пространств с открытыми менеджерами, от давних к свежим"""
+        with self._lock:
+            return list(self._open)
+
+    def close(self):
+        """Остановка фоновых потоков и закрытие всех открытых менеджеров"""
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join()
+        self.pool.shutdown(wait=True)
+        with self._lock:
+            for manager, _last_used, _users in self._open.values():
+                manager.close()
+            self._open.clear()
+
+    # Запросы администратора по всем пространствам
+    def map(self, func, names=None):
+        """func(manager) для каждого пространства параллельно: {имя: результат}"""
+        names = self.names() if names is None else [workspace_name(name) for name in names]
+
+        def run(name):
+            with self.open(name) as manager:
+                return func(manager)
+
+        futures = {name: self.pool.submit(run, name) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def stats(self):
+        """Количество проектов, задач и комментариев и размер файла каждого пространства"""
+        def collect(manager):
+            db = manager.db
+            return {
+                'projects': db.fetch_one("SELECT COUNT(*) FROM projects")[0],
+                'tasks': db.fetch_one("SELECT COUNT(*) FROM tasks")[0],
+                'comments': db.fetch_one("SELECT COUNT(*) FROM comments")[0],
+                'size': os.path.getsize(db.db_name),
+            }
+        return self.map(collect)
+
+    def search_tasks(self, text, include_archived=False):
+        """Поиск задач во всех пространствах (в каждой задаче - ключ 'workspace')"""
+        found = self.map(lambda manager: manager.search_tasks(text, include_archived=include_archived))
+        return self._merge(found, 'created_date')
+
+    def get_most_active_tasks(self, limit=20):
+        """Самые активные задачи всех пространств"""
+        found = self.map(lambda manager: manager.get_most_active_tasks(limit))
+        return self._merge(found, 'last_activity')[:limit]
+
+    @staticmethod
+    def _merge(found, sort_key):
+        tasks = []
+        for name, workspace_tasks in found.items():
+            for task in workspace_tasks:
+                task['workspace'] = name
+                tasks.append(task)
+        tasks.sort(key=lambda task: task[sort_key] or '', reverse=True)
+        return tasks
+
+
+def main():
+    """Управление пространствами из командной строки"""
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Рабочие пространства TaskFlow")
+    parser.add_argument('--dir', default=os.environ.get('TASKFLOW_WORKSPACES', 'workspaces'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help="список пространств")
+    command = commands.add_parser('create', help="создать пространство")
+    command.add_argument('name')
+    commands.add_parser('stats', help="размеры всех пространств")
+    command = commands.add_parser('search', help="поиск задач во всех пространствах")
+    command.add_argument('text')
+    command.add_argument('--archived', action='store_true')
+    command = commands.add_parser('active', help="самые активные задачи всех пространств")
+    command.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    registry = WorkspaceRegistry(args.dir)
+    try:
+        if args.command == 'list':
+            for name in registry.names():
+                print(name)
+        elif args.command == 'create':
+            if not registry.create(workspace_name(args.name)):
+                print(f"Пространство уже существует: {args.name}")
+                return 1
+            print(registry.path(args.name))
+        elif args.command == 'stats':
+            for name, stats in registry.stats().items():
+                print(f"{name}  проектов: {stats['projects']}  задач: {stats['tasks']}  "
+                      f"комментариев: {stats['comments']}  {stats['size']} байт")
+        elif args.command == 'search':
+            for task in registry.search_tasks(args.text, args.archived):
+                print(json.dumps(task, ensure_ascii=False))
+        elif args.command == 'active':
+            for task in registry.get_most_active_tasks(args.limit):
+                print(json.dumps(task, ensure_ascii=False))
+    except ValueError as e:
+        print(e)
+        return 1
+    finally:
+        registry.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())